@@ -3,3 +3,84 @@ from django.conf import settings
 # Max time a task can be running until another one can be runned.
 # This is to prevent when a task is blocked.
 MAX_TASK_RUNTIME = getattr(settings, "GEOSOURCE_MAX_TASK_RUNTIME", 24)
+
+# Dotted path of a callback writing features by batches. When defined, it is used
+# instead of GEOSOURCE_FEATURE_CALLBACK during a refresh.
+FEATURE_BATCH_CALLBACK = getattr(settings, "GEOSOURCE_FEATURE_BATCH_CALLBACK", None)
+
+# Number of features buffered before calling the batch callback
+FEATURE_BATCH_SIZE = getattr(settings, "GEOSOURCE_FEATURE_BATCH_SIZE", 1000)
+
+# Number of rows fetched at once from the database of a PostGISSource
+POSTGIS_ITERSIZE = getattr(settings, "GEOSOURCE_POSTGIS_ITERSIZE", 2000)
+
+# Only write features whose content changed since the last refresh. A digest of
+# each feature is stored in FeatureHash to detect unchanged ones.
+DIFFERENTIAL_REFRESH = getattr(settings, "GEOSOURCE_DIFFERENTIAL_REFRESH", False)
+
+# Number of records committed at once during a refresh. When defined, a refresh is
+# split in several transactions, and resumes after its last chunk if interrupted.
+REFRESH_CHUNK_SIZE = getattr(settings, "GEOSOURCE_REFRESH_CHUNK_SIZE", None)
+
+# Minimal delay in seconds between two checkpoints of a refresh by chunks, the chunks
+# committed since the last checkpoint are imported again when resuming
+REFRESH_CHECKPOINT_INTERVAL = getattr(
+    settings, "GEOSOURCE_REFRESH_CHECKPOINT_INTERVAL", 60
+)
+
+# Number of features deleted at once when clearing features not anymore in a source
+CLEAR_FEATURES_CHUNK_SIZE = getattr(
+    settings, "GEOSOURCE_CLEAR_FEATURES_CHUNK_SIZE", 10000
+)
+
+# Minimal delay in seconds between two progress updates of a running refresh
+PROGRESS_INTERVAL = getattr(settings, "GEOSOURCE_PROGRESS_INTERVAL", 10)
+
+# Max number of refreshes run at once by auto_refresh_source, None for no limit
+REFRESH_CONCURRENCY = getattr(settings, "GEOSOURCE_REFRESH_CONCURRENCY", 2)
+
+# Max number of refreshes run at once by source type, as {"PostGISSource": 1}
+REFRESH_CONCURRENCY_PER_TYPE = getattr(
+    settings, "GEOSOURCE_REFRESH_CONCURRENCY_PER_TYPE", {}
+)
+
+# Seconds deducted from the expected duration of a refresh for each second its source
+# is overdue, so costly sources are not postponed forever by cheaper ones
+REFRESH_AGING = getattr(settings, "GEOSOURCE_REFRESH_AGING", 1)
+
+# Default and max number of records returned by the preview of a source
+PREVIEW_SIZE = getattr(settings, "GEOSOURCE_PREVIEW_SIZE", 20)
+
+# Seconds during which a preview is cached, it is also invalidated when its source
+# is saved
+PREVIEW_CACHE_TIMEOUT = getattr(settings, "GEOSOURCE_PREVIEW_CACHE_TIMEOUT", 300)
+
+# Seconds during which the empty columns found by a full read of a CSV source are
+# reused by its previews and validations
+NULL_COLUMNS_CACHE_TIMEOUT = getattr(
+    settings, "GEOSOURCE_NULL_COLUMNS_CACHE_TIMEOUT", 24 * 60 * 60
+)
+
+# Max number of distinct values of a field indexed by a refresh, for the
+# property_values endpoint. Fields with more values are read from their layer.
+FIELD_VALUES_LIMIT = getattr(settings, "GEOSOURCE_FIELD_VALUES_LIMIT", 1000)
+
+# Number of messages and lines kept in a source report for each kind of warning,
+# all of them are counted in its occurrences
+REPORT_SAMPLE_SIZE = getattr(settings, "GEOSOURCE_REPORT_SAMPLE_SIZE", 100)
+
+# Minimal delay in seconds between two saves of a report while records are read
+REPORT_SAVE_INTERVAL = getattr(settings, "GEOSOURCE_REPORT_SAVE_INTERVAL", 10)
+
+# Max number of connections opened by a process to the database of PostGIS sources,
+# by server, database and user
+POSTGIS_POOL_SIZE = getattr(settings, "GEOSOURCE_POSTGIS_POOL_SIZE", 5)
+
+# Seconds after which an unused connection to a PostGIS source database is closed
+POSTGIS_POOL_IDLE_TIMEOUT = getattr(
+    settings, "GEOSOURCE_POSTGIS_POOL_IDLE_TIMEOUT", 300
+)
+
+# Max seconds to wait for a connection to a PostGIS source database, when all of
+# them are used
+POSTGIS_POOL_TIMEOUT = getattr(settings, "GEOSOURCE_POSTGIS_POOL_TIMEOUT", 30)
@@ -1,7 +1,21 @@
 import importlib
+import inspect
 
 
 def get_attr_from_path(path):
     module_path, attr_name = path.rsplit(".", 1)
     module = importlib.import_module(module_path)
     return getattr(module, attr_name)
+
+
+def accepts_argument(func, name):
+    """Whether func can be called with the name keyword argument"""
+    for parameter in inspect.signature(func).parameters.values():
+        if parameter.kind == parameter.VAR_KEYWORD:
+            return True
+        if parameter.name == name and parameter.kind in (
+            parameter.POSITIONAL_OR_KEYWORD,
+            parameter.KEYWORD_ONLY,
+        ):
+            return True
+    return False
@@ -1,11 +1,24 @@
 import logging
+from collections import Counter
 
 from django.contrib.auth.models import Group
-from django.contrib.gis.geos import GEOSGeometry
-from geostore.models import Layer, LayerGroup
+from django.contrib.gis.geos import GEOSGeometry, WKBWriter
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from geostore import settings as geostore_settings
+from geostore.helpers import execute_async_func
+from geostore.models import Feature, Layer, LayerGroup
+from geostore.tasks import feature_update_relations_destinations
+from psycopg2.extras import execute_values
+
+from .app_settings import CLEAR_FEATURES_CHUNK_SIZE
+from .readers import to_wgs84
 
 logger = logging.getLogger(__name__)
 
+SEEN_IDENTIFIERS_TABLE = "geosource_seen_identifiers"
+
 
 def layer_callback(geosource):
 
@@ -29,11 +42,20 @@ def layer_callback(geosource):
     return layer
 
 
+def _reproject(geosource, geometry):
+    """Return geometry in 4326 projection, timing its parsing and reprojection"""
+    if not isinstance(geometry, GEOSGeometry):
+        # As PostGIS records, whose geometries are built by the callbacks
+        with geosource.refresh_stage("parse", items=1):
+            geometry = GEOSGeometry(geometry)
+    with geosource.refresh_stage("reproject", items=1):
+        return to_wgs84(geometry)
+
+
 def feature_callback(geosource, layer, identifier, geometry, attributes):
     # Force converting geometry to 4326 projection
     try:
-        geom = GEOSGeometry(geometry)
-        geom.transform(4326)
+        geom = _reproject(geosource, geometry)
         return layer.features.update_or_create(
             identifier=identifier, defaults={"properties": attributes, "geom": geom}
         )[0]
@@ -44,8 +66,128 @@ def feature_callback(geosource, layer, identifier, geometry, attributes):
         return None
 
 
-def clear_features(geosource, layer, begin_date):
-    return layer.features.filter(updated_at__lt=begin_date).delete()
+def features_callback(geosource, layer, features):
+    """Write a batch of ``(identifier, geometry, attributes)`` features.
+
+    Returns a list aligned on ``features`` containing the written feature, or None
+    when the record was ignored, like ``feature_callback`` does for one record.
+    """
+    results = [None] * len(features)
+    # Indexes of each identifier in the batch, the last occurrence wins as it would
+    # with successive calls to update_or_create
+    indexes = {}
+    values = {}
+
+    for i, (identifier, geometry, attributes) in enumerate(features):
+        # Force converting geometry to 4326 projection
+        try:
+            geom = _reproject(geosource, geometry)
+        except (TypeError, ValueError):
+            logger.warning(
+                f"One record was ignored from source, because of invalid geometry: {attributes}"
+            )
+            continue
+
+        if geom.hasz:
+            # Same as Feature.save(), 3D geometries are stored in 2D
+            geom = GEOSGeometry(WKBWriter().write(geom), srid=geom.srid)
+
+        indexes.setdefault(str(identifier), []).append(i)
+        values[str(identifier)] = {"geom": geom, "properties": attributes}
+
+    now = timezone.now()
+    written = {}
+    to_update = []
+    for feature in layer.features.filter(identifier__in=values.keys()).only(
+        "pk", "identifier"
+    ):
+        feature.geom = values[feature.identifier]["geom"]
+        feature.properties = values[feature.identifier]["properties"]
+        feature.updated_at = now
+        to_update.append(feature)
+        written[feature.identifier] = feature
+
+    to_create = [
+        Feature(layer=layer, identifier=identifier, **value)
+        for identifier, value in values.items()
+        if identifier not in written
+    ]
+
+    Feature.objects.bulk_update(to_update, ["geom", "properties", "updated_at"])
+    Feature.objects.bulk_create(to_create)
+    written.update({feature.identifier: feature for feature in to_create})
+
+    if geostore_settings.GEOSTORE_RELATION_CELERY_ASYNC:
+        # Bulk writes skip geostore's post_save receiver, which updates the layer
+        # relations of each saved feature
+        for feature in written.values():
+            execute_async_func(feature_update_relations_destinations, (feature.pk,))
+
+    for identifier, feature_indexes in indexes.items():
+        for i in feature_indexes:
+            results[i] = written[identifier]
+
+    return results
+
+
+@transaction.atomic
+def clear_features(geosource, layer, begin_date, identifiers=None):
+    """Delete features of layer not anymore in the source, by chunks.
+
+    When the identifiers seen during the refresh are given, they are copied to a
+    temporary table and the features missing from it are deleted. Else features not
+    updated since begin_date are deleted.
+    """
+    if identifiers is None:
+        # Features skipped by a differential refresh are still in the source
+        seen = geosource.feature_hashes.filter(
+            seen_at__gte=begin_date, identifier=OuterRef("identifier")
+        )
+        stale = (
+            layer.features.filter(updated_at__lt=begin_date)
+            .annotate(seen=Exists(seen))
+            .filter(seen=False)
+        )
+        pks = list(stale.values_list("pk", flat=True))
+    else:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE {SEEN_IDENTIFIERS_TABLE} "
+                "(identifier varchar PRIMARY KEY) ON COMMIT DROP"
+            )
+            execute_values(
+                cursor.cursor,
+                f"INSERT INTO {SEEN_IDENTIFIERS_TABLE} VALUES %s",
+                ((identifier,) for identifier in identifiers),
+                page_size=CLEAR_FEATURES_CHUNK_SIZE,
+            )
+            cursor.execute(f"ANALYZE {SEEN_IDENTIFIERS_TABLE}")
+            # An anti-join, as NOT IN falls back to a scan of the identifiers for
+            # each feature when they don't fit in memory
+            cursor.execute(
+                f"SELECT f.{Feature._meta.pk.column} FROM {Feature._meta.db_table} f "
+                f"WHERE f.{Feature._meta.get_field('layer').column} = %s "
+                f"AND NOT EXISTS (SELECT 1 FROM {SEEN_IDENTIFIERS_TABLE} s "
+                "WHERE s.identifier = f.identifier)",
+                [layer.pk],
+            )
+            pks = [row[0] for row in cursor.fetchall()]
+
+    deleted = 0
+    deleted_per_model = Counter()
+    # Stale features are found once, then deleted by bounded chunks, to keep each
+    # statement short
+    for start in range(0, len(pks), CLEAR_FEATURES_CHUNK_SIZE):
+        end = start + CLEAR_FEATURES_CHUNK_SIZE
+        count, per_model = Feature.objects.filter(pk__in=pks[start:end]).delete()
+        deleted += count
+        deleted_per_model.update(per_model)
+
+    if identifiers is not None:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {SEEN_IDENTIFIERS_TABLE}")
+
+    return deleted, dict(deleted_per_model)
 
 
 def delete_layer(geosource):
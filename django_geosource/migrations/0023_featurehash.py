@@ -0,0 +1,42 @@
+# Generated by Django 3.2.25 on 2026-10-17 00:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_geosource", "0022_auto_20220304_1455"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FeatureHash",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("identifier", models.CharField(max_length=255)),
+                ("hash", models.CharField(max_length=40)),
+                ("seen_at", models.DateTimeField()),
+                (
+                    "source",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="feature_hashes",
+                        to="django_geosource.source",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("source", "identifier")},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-17 00:17
+
+from django.db import migrations
+
+try:
+    from django.db.models import JSONField
+except ImportError:  # TODO Remove when dropping Django releases < 3.1
+    from django.contrib.postgres.fields import JSONField
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_geosource", "0023_featurehash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="source",
+            name="refresh_checkpoint",
+            field=JSONField(default=dict, editable=False),
+        ),
+    ]
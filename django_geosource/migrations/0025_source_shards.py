@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-17 00:18
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_geosource", "0024_source_refresh_checkpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="source",
+            name="shards",
+            field=models.PositiveSmallIntegerField(
+                default=1, validators=[django.core.validators.MinValueValidator(1)]
+            ),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.25 on 2026-10-17 00:30
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+try:
+    from django.db.models import JSONField
+except ImportError:  # TODO Remove when dropping Django releases < 3.1
+    from django.contrib.postgres.fields import JSONField
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_geosource", "0025_source_shards"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="source",
+            name="task_done",
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="source",
+            name="task_result",
+            field=JSONField(
+                default=dict,
+                editable=False,
+                encoder=django.core.serializers.json.DjangoJSONEncoder,
+            ),
+        ),
+        migrations.AddField(
+            model_name="source",
+            name="task_state",
+            field=models.CharField(editable=False, max_length=50, null=True),
+        ),
+    ]
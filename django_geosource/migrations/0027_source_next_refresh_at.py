@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-17 00:31
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def set_next_refresh(apps, schema_editor):
+    PostGISSource = apps.get_model("django_geosource", "PostGISSource")
+    for source in PostGISSource.objects.filter(refresh__gte=1):
+        PostGISSource.objects.filter(pk=source.pk).update(
+            next_refresh_at=source.last_refresh + timedelta(minutes=source.refresh)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_geosource", "0026_source_task_state"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="source",
+            name="next_refresh_at",
+            field=models.DateTimeField(db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(set_next_refresh, migrations.RunPython.noop),
+    ]
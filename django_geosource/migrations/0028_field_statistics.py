@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-17 00:38
+
+import django.core.serializers.json
+from django.db import migrations
+
+try:
+    from django.db.models import JSONField
+except ImportError:  # TODO Remove when dropping Django releases < 3.1
+    from django.contrib.postgres.fields import JSONField
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_geosource", "0027_source_next_refresh_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="field",
+            name="statistics",
+            field=JSONField(
+                default=dict,
+                editable=False,
+                encoder=django.core.serializers.json.DjangoJSONEncoder,
+            ),
+        ),
+    ]
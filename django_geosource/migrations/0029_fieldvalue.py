@@ -0,0 +1,52 @@
+# Generated by Django 3.2.25 on 2026-10-17 00:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+try:
+    from django.db.models import JSONField
+except ImportError:  # TODO Remove when dropping Django releases < 3.1
+    from django.contrib.postgres.fields import JSONField
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_geosource", "0028_field_statistics"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FieldValue",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("field", models.CharField(max_length=255)),
+                ("value", JSONField(null=True)),
+                ("text", models.CharField(max_length=255)),
+                ("count", models.PositiveIntegerField()),
+                (
+                    "source",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="field_values",
+                        to="django_geosource.source",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="fieldvalue",
+            index=models.Index(
+                fields=["source", "field", "text"],
+                name="django_geos_source__aa4187_idx",
+            ),
+        ),
+    ]
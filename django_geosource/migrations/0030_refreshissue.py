@@ -0,0 +1,56 @@
+# Generated by Django 3.2.25 on 2026-10-17 00:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django_geosource.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_geosource", "0029_fieldvalue"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RefreshIssue",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("run", models.DateTimeField()),
+                ("line", models.PositiveIntegerField(null=True)),
+                (
+                    "severity",
+                    models.IntegerField(
+                        choices=[
+                            (0, django_geosource.models.IssueSeverity["Warning"]),
+                            (1, django_geosource.models.IssueSeverity["Error"]),
+                        ]
+                    ),
+                ),
+                ("kind", models.CharField(max_length=50)),
+                ("message", models.TextField()),
+                (
+                    "source",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="issues",
+                        to="django_geosource.source",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="refreshissue",
+            index=models.Index(
+                fields=["source", "run", "line"], name="django_geos_source__d05da0_idx"
+            ),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from datetime import timedelta
 
 from celery import states
+from celery.utils import uuid
 from django.utils.timezone import now
 from django_geosource.tasks import run_model_object_method
 from rest_framework.exceptions import MethodNotAllowed
@@ -11,16 +12,39 @@ from .app_settings import MAX_TASK_RUNTIME
 class CeleryCallMethodsMixin:
 
     DONE_STATUSES = ("SUCCESS", "FAILURE", "NEED_SYNC", None)
+    # Methods holding a lock while running, reported as "locked" by get_status
+    LOCKED_METHODS = ()
 
-    def update_status(self, task):
-        self.task_id = task.task_id
+    def update_status(self, task_id):
+        """Store the task about to be run, its outcome is then stored by the task"""
+        self.task_id = task_id
         self.task_date = now()
-        self.save()
+        self.task_state = states.PENDING
+        self.task_done = None
+        self.task_result = {}
+        self.save(
+            update_fields=[
+                "task_id",
+                "task_date",
+                "task_state",
+                "task_done",
+                "task_result",
+            ]
+        )
 
     @property
     def can_sync(self):
         """Property containing a boolean that tell if the state allow to run a sync"""
-        status = self.get_status()
+        status = self.get_status(progress=False)
+
+        if status.get("locked"):
+            return False
+        if (
+            status.get("state") == states.STARTED
+            and status.get("action") in self.LOCKED_METHODS
+        ):
+            # Its lock is released, the task died before storing its state
+            return True
 
         return status.get("state") in self.DONE_STATUSES or (
             status.get("state") not in self.DONE_STATUSES
@@ -40,7 +64,9 @@ class CeleryCallMethodsMixin:
         `force` argument.
         """
         if self.can_sync or force:
-            task_job = run_model_object_method.apply_async(
+            task_id = uuid()
+            self.update_status(task_id)
+            return run_model_object_method.apply_async(
                 (
                     self._meta.app_label,
                     self.__class__.__name__,
@@ -49,17 +75,17 @@ class CeleryCallMethodsMixin:
                     success_state,
                 ),
                 countdown=countdown,
+                task_id=task_id,
             )
 
-            self.update_status(task_job)
-            return task_job
-
         raise MethodNotAllowed("One job is still running on this source")
 
     def run_sync_method(self, method, success_state=states.SUCCESS):
         """Run an object method in a synchrone mode.
         The success state of the task can be defined with the `success_state` argument.
         """
+        task_id = uuid()
+        self.update_status(task_id)
         task_job = run_model_object_method.apply(
             (
                 self._meta.app_label,
@@ -67,7 +93,8 @@ class CeleryCallMethodsMixin:
                 self.pk,
                 method,
                 success_state,
-            )
+            ),
+            task_id=task_id,
         )
-        self.update_status(task_job)
+        self.refresh_from_db(fields=["task_state", "task_done", "task_result"])
         return task_job
@@ -1,17 +1,27 @@
+import hashlib
 import json
 import sys
+import time
+import zlib
+from contextlib import closing, contextmanager
+from functools import partial
 from io import BytesIO
+from itertools import islice
 from datetime import datetime, timedelta
 from enum import Enum, IntEnum, auto
 
 import fiona
 import psycopg2
 import pyexcel
+import pyexcel_io
+from celery import chord, states
 from celery.result import AsyncResult
+from celery.utils import uuid
 from celery.utils.log import LoggingProxy
 from django.conf import settings
+from django.core.cache import cache
 from django.contrib.gis.gdal.error import GDALException
-from django.contrib.gis.geos import GEOSGeometry
+from django.contrib.gis.geos import GEOSException, GEOSGeometry
 
 try:
     from django.db.models import JSONField
@@ -19,18 +29,52 @@ except ImportError:  # TODO Remove when dropping Django releases < 3.1
     from django.contrib.postgres.fields import JSONField
 
 from django.core.management import call_command
-from django.db import models, transaction
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.validators import MinValueValidator
+from django.db import connection, models, transaction
+from django.db.models import Exists, OuterRef
 from django.utils.text import slugify
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from polymorphic.models import PolymorphicModel
+from pyexcel.sheet import make_names_unique
 from psycopg2 import sql
-
-from .callbacks import get_attr_from_path
+from rest_framework.exceptions import MethodNotAllowed
+
+from .app_settings import (
+    DIFFERENTIAL_REFRESH,
+    FEATURE_BATCH_CALLBACK,
+    FEATURE_BATCH_SIZE,
+    NULL_COLUMNS_CACHE_TIMEOUT,
+    POSTGIS_ITERSIZE,
+    PREVIEW_CACHE_TIMEOUT,
+    PREVIEW_SIZE,
+    REFRESH_CHECKPOINT_INTERVAL,
+    REFRESH_CHUNK_SIZE,
+)
+from .callbacks import accepts_argument, get_attr_from_path
 
 # from .celery import app as celery_app
 from .fields import LongURLField
 from .mixins import CeleryCallMethodsMixin
+from .pool import pool
+from .profiler import FieldProfiler
+from .readers import (
+    geometry_from_mapping,
+    iter_geojson_features,
+    local_file_path,
+    to_wgs84,
+)
+from .reports import ReportCollector
 from .signals import refresh_data_done
+from .tasks import (
+    PROGRESS_STATE,
+    ProgressReporter,
+    fail_source_refresh,
+    finish_source_refresh,
+    refresh_source_shard,
+)
+from .timers import StageTimer
 
 
 # Decimal fields must be returned as float
@@ -97,12 +141,35 @@ class Source(PolymorphicModel, CeleryCallMethodsMixin):
 
     task_id = models.CharField(null=True, max_length=255)
     task_date = models.DateTimeField(null=True)
+    # Outcome of the last task, stored by the task itself
+    task_state = models.CharField(null=True, max_length=50, editable=False)
+    task_done = models.DateTimeField(null=True, editable=False)
+    task_result = JSONField(default=dict, editable=False, encoder=DjangoJSONEncoder)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     last_refresh = models.DateTimeField(default=timezone.now)
+    next_refresh_at = models.DateTimeField(null=True, editable=False, db_index=True)
+    refresh_checkpoint = JSONField(default=dict, editable=False)
+    shards = models.PositiveSmallIntegerField(
+        default=1, validators=[MinValueValidator(1)]
+    )
 
     SOURCE_GEOM_ATTRIBUTE = "_geom_"
     MAX_SAMPLE_DATA = 5
+    CAN_BE_SHARDED = True
+    # Records are read in the same order by each refresh, so an interrupted one can
+    # resume after its last chunk
+    CAN_RESUME_REFRESH = True
+    # First key of the advisory locks held by refreshes, the second being the pk
+    REFRESH_LOCK_NAMESPACE = 0x67656F73
+    LOCKED_METHODS = ("refresh_data", "finish_refresh")
+    RUNNING_STATES = states.UNREADY_STATES | {PROGRESS_STATE}
+    # Beginning date of the refresh reading the records, to store their issues
+    refresh_run = None
+    # Report of the refresh shard reading the records, to add their warnings to it
+    refresh_report = None
+    # Timer of the refresh reading the records, to time parsing and reprojection
+    refresh_timer = None
 
     class Meta:
         permissions = (("can_manage_sources", "Can manage sources"),)
@@ -113,10 +180,16 @@ class Source(PolymorphicModel, CeleryCallMethodsMixin):
     def update_feature(self, *args):
         return get_attr_from_path(settings.GEOSOURCE_FEATURE_CALLBACK)(self, *args)
 
-    def clear_features(self, layer, begin_date):
-        return get_attr_from_path(settings.GEOSOURCE_CLEAN_FEATURE_CALLBACK)(
-            self, layer, begin_date
-        )
+    def update_features(self, layer, features):
+        return get_attr_from_path(FEATURE_BATCH_CALLBACK)(self, layer, features)
+
+    def clear_features(self, layer, begin_date, identifiers=None):
+        callback = get_attr_from_path(settings.GEOSOURCE_CLEAN_FEATURE_CALLBACK)
+        kwargs = {}
+        if identifiers is not None and accepts_argument(callback, "identifiers"):
+            # Only given when known, and to callbacks supporting it
+            kwargs["identifiers"] = identifiers
+        return callback(self, layer, begin_date, **kwargs)
 
     def delete(self, *args, **kwargs):
         get_attr_from_path(settings.GEOSOURCE_DELETE_LAYER_CALLBACK)(self)
@@ -124,51 +197,333 @@ class Source(PolymorphicModel, CeleryCallMethodsMixin):
 
     def save(self, *args, **kwargs):
         self.slug = slugify(self.name)
+        self.next_refresh_at = self.get_next_refresh()
         return super().save(*args, **kwargs)
 
-    def should_refresh(self):
-        now = timezone.now()
+    def get_next_refresh(self):
+        """Date of the next automatic refresh, None if not refreshed automatically"""
         if not getattr(self, "refresh", None) or self.refresh < 1:
-            return False
-        next_run = self.last_refresh + timedelta(minutes=self.refresh)
-        return next_run < now
+            return None
+        return self.last_refresh + timedelta(minutes=self.refresh)
 
-    def refresh_data(self):
+    def should_refresh(self):
+        next_run = self.get_next_refresh()
+        return next_run is not None and next_run < timezone.now()
+
+    @contextmanager
+    def refresh_lock(self, shared=False):
+        """Hold the advisory lock of the source refresh for the block.
+
+        The lock belongs to the database session, so it is released if the worker
+        dies. Shards of a refresh share it.
+        """
+        mode = "_shared" if shared else ""
+        key = [self.REFRESH_LOCK_NAMESPACE, self.pk]
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT pg_try_advisory_lock{mode}(%s, %s)", key)
+            if not cursor.fetchone()[0]:
+                raise MethodNotAllowed("One refresh is still running on this source")
         try:
-            return self._refresh_data()
+            yield
         finally:
-            self.last_refresh = timezone.now()
-            self.save()
-            layer = self.get_layer()
-            refresh_data_done.send_robust(
-                sender=self.__class__,
-                layer=layer.pk,
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT pg_advisory_unlock{mode}(%s, %s)", key)
+
+    def is_refresh_locked(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT EXISTS (
+                    SELECT 1 FROM pg_locks
+                    WHERE locktype = 'advisory' AND classid = %s AND objid = %s
+                    AND objsubid = 2 AND database = (
+                        SELECT oid FROM pg_database WHERE datname = current_database()
+                    )
+                )
+                """,
+                [self.REFRESH_LOCK_NAMESPACE, self.pk],
             )
+            return cursor.fetchone()[0]
 
-    def _refresh_data(self):
+    def refresh_data(self):
+        with self.refresh_lock():
+            try:
+                return self._refresh_data()
+            finally:
+                self.refresh_run = None
+                self.refresh_timer = None
+                self._refresh_done()
+
+    @contextmanager
+    def refresh_stage(self, name, items=0):
+        """Count the time spent in the block in a stage of the running refresh"""
+        if self.refresh_timer is None:
+            yield
+        else:
+            with self.refresh_timer.stage(name, items=items):
+                yield
+
+    def _save_report(self):
+        self.save(update_fields=["report"])
+
+    def _get_report_collector(self, report=None, run=None):
+        """Collector of a refresh report, or of the source one when not given.
+
+        Issues are written as RefreshIssue rows during a refresh.
+        """
+        if report is None and self.refresh_report is not None:
+            collector = ReportCollector(self.refresh_report)
+        elif report is None:
+            collector = ReportCollector(self.report, save=self._save_report)
+        else:
+            collector = ReportCollector(report)
+        run = run or self.refresh_run
+        if run is not None:
+            collector.write_issues = partial(self._write_issues, run)
+        return collector
+
+    def _write_issues(self, run, issues):
+        RefreshIssue.objects.bulk_create(
+            RefreshIssue(
+                source=self,
+                run=run,
+                kind=kind,
+                message=message,
+                line=line,
+                severity=IssueSeverity[status].value,
+            )
+            for kind, message, line, status in issues
+        )
+
+    def _refresh_done(self):
+        self.last_refresh = timezone.now()
+        self.save()
+        layer = self.get_layer()
+        refresh_data_done.send_robust(
+            sender=self.__class__,
+            layer=layer.pk,
+        )
+
+    def run_async_method(
+        self,
+        method,
+        success_state=states.SUCCESS,
+        force=False,
+        countdown=None,
+    ):
+        if method in self.LOCKED_METHODS and self.is_refresh_locked():
+            # Even when forced, the running task must stay the source one
+            raise MethodNotAllowed("One refresh is still running on this source")
+        if method != "refresh_data" or not self.CAN_BE_SHARDED or self.shards < 2:
+            return super().run_async_method(method, success_state, force, countdown)
+
+        if not (self.can_sync or force):
+            raise MethodNotAllowed("One job is still running on this source")
+
+        # Shards are imported in parallel, then a last task clears stale features
+        begin_date = timezone.now().isoformat()
+        args = (self._meta.app_label, self.__class__.__name__, self.pk)
+        task_id = uuid()
+        self.update_status(task_id)
+        finish = finish_source_refresh.s(*args, begin_date).set(task_id=task_id)
+        # Called instead of finish_source_refresh if a shard fails
+        finish.link_error(fail_source_refresh.s(*args))
+        return chord(
+            (
+                refresh_source_shard.s(*args, shard, begin_date)
+                for shard in range(self.shards)
+            ),
+            finish,
+        ).apply_async(countdown=countdown)
+
+    def refresh_shard(self, shard, begin_date):
         report = {}
-        with transaction.atomic():
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+        timer = StageTimer()
+        profiler = FieldProfiler()
+        # Warnings of the readers are merged with the shard report, instead of being
+        # saved by every shard on the source
+        self.refresh_run = begin_date
+        self.refresh_report = report
+        self.refresh_timer = timer
+        try:
+            with self.refresh_lock(shared=True), timer.stage(
+                "other"
+            ), transaction.atomic():
+                layer = self.get_layer()
+                total, row_count = self._import_records(
+                    layer,
+                    self._get_shard_records(shard),
+                    begin_date,
+                    report,
+                    counts,
+                    timer=timer,
+                    profiler=profiler,
+                )
+        finally:
+            self.refresh_run = None
+            self.refresh_report = None
+            self.refresh_timer = None
+        return {
+            "count": row_count,
+            "total": total,
+            "report": report,
+            "counts": counts,
+            "stages": timer.as_dict(),
+            "profile": profiler.as_state(),
+        }
+
+    def finish_refresh(self, results, begin_date):
+        with self.refresh_lock():
+            try:
+                report = {}
+                counts = {"inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+                total = 0
+                row_count = 0
+                timer = StageTimer()
+                profiler = FieldProfiler()
+                collector = ReportCollector(report)
+                for result in results:
+                    timer.merge(result["stages"])
+                    profiler.merge(result["profile"])
+                    total += result["total"]
+                    row_count += result["count"]
+                    for key, value in result["counts"].items():
+                        counts[key] += value
+                    collector.merge(result["report"])
+
+                with timer.stage("other"), transaction.atomic():
+                    self._clear_features(
+                        self.get_layer(), begin_date, counts, timer=timer
+                    )
+
+                return self._end_refresh(
+                    report, counts, row_count, total, timer, profiler
+                )
+            finally:
+                self._refresh_done()
+
+    def in_shard(self, record, shard):
+        """Whether a record belongs to a shard, split by identifier"""
+        identifier = str(record.get(self.id_field)).encode()
+        return zlib.crc32(identifier) % self.shards == shard
+
+    def _get_shard_records(self, shard):
+        """Yield (index, record) pairs of a shard, split by identifier.
+
+        Records of other shards are given as None by _get_records, before building
+        their geometry, so indexes are the ones of the whole source.
+        """
+        for i, record in enumerate(self._get_records(shard=shard)):
+            if record is not None and self.in_shard(record, shard):
+                yield i, record
+
+    def _refresh_data(self):
+        checkpoint = {}
+        if REFRESH_CHUNK_SIZE and self.CAN_RESUME_REFRESH:
+            checkpoint = self.refresh_checkpoint
+        if checkpoint:
+            # Resume an interrupted refresh after its last checkpoint
+            begin_date = parse_datetime(checkpoint["begin_date"])
+        else:
+            begin_date = timezone.now()
+        self.refresh_run = begin_date
+        report = checkpoint.get("report", {})
+        counts = checkpoint.get(
+            "counts", {"inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+        )
+        total = checkpoint.get("offset", 0)
+        row_count = checkpoint.get("count", 0)
+        # Identifiers written by this refresh, unknown for a resumed one
+        seen = None if checkpoint else set()
+        timer = self.refresh_timer = StageTimer(checkpoint.get("stages"))
+        profiler = FieldProfiler(checkpoint.get("profile"))
+        # The total of the previous refresh is the best known estimate
+        progress = ProgressReporter(total=self.report.get("total"), done=total)
+
+        if REFRESH_CHUNK_SIZE:
             layer = self.get_layer()
-            begin_date = datetime.now()
-            row_count = 0
-            total = 0
+            # Issues of the chunks committed after the checkpoint are found again
+            self.issues.filter(run=begin_date, line__gte=total).delete()
+            records = islice(enumerate(self._get_records()), total, None)
+            saved_at = time.monotonic()
+            while True:
+                with timer.stage("other"), transaction.atomic():
+                    read, written = self._import_records(
+                        layer,
+                        islice(records, REFRESH_CHUNK_SIZE),
+                        begin_date,
+                        report,
+                        counts,
+                        seen,
+                        timer,
+                        progress,
+                        profiler,
+                    )
+                    total += read
+                    row_count += written
+                    # The checkpoint holds the profiler state, so it is not saved
+                    # with every chunk
+                    if (
+                        read
+                        and time.monotonic() - saved_at >= REFRESH_CHECKPOINT_INTERVAL
+                    ):
+                        saved_at = time.monotonic()
+                        self.refresh_checkpoint = {
+                            "begin_date": begin_date.isoformat(),
+                            "offset": total,
+                            "count": row_count,
+                            "report": report,
+                            "counts": counts,
+                            "stages": timer.as_dict(),
+                            "profile": profiler.as_state(),
+                        }
+                        self.save(update_fields=["refresh_checkpoint"])
+                if read < REFRESH_CHUNK_SIZE:
+                    break
+
+            # Stale features are only known once the full pass is done
+            progress.publish("clear", force=True)
+            with timer.stage("other"), transaction.atomic():
+                self._clear_features(layer, begin_date, counts, seen, timer)
+                self.refresh_checkpoint = {}
+                self.save(update_fields=["refresh_checkpoint"])
+        else:
+            with timer.stage("other"), transaction.atomic():
+                layer = self.get_layer()
+                total, row_count = self._import_records(
+                    layer,
+                    enumerate(self._get_records()),
+                    begin_date,
+                    report,
+                    counts,
+                    seen,
+                    timer,
+                    progress,
+                    profiler,
+                )
+                progress.publish("clear", force=True)
+                self._clear_features(layer, begin_date, counts, seen, timer)
 
-            for i, row in enumerate(self._get_records()):
-                total += 1
-                geometry = row.pop(self.SOURCE_GEOM_ATTRIBUTE)
-                try:
-                    identifier = row[self.id_field]
-                except KeyError:
-                    msg = "Can't find identifier field for this record"
-                    report["status"] = "Warning"
-                    report.setdefault("message", []).append(msg)
-                    report.setdefault("lines", {}).setdefault(f"{i}", []).append(msg)
-                    continue
-                self.update_feature(layer, identifier, geometry, row)
-                row_count += 1
-            self.clear_features(layer, begin_date)
+        return self._end_refresh(report, counts, row_count, total, timer, profiler)
+
+    def _end_refresh(self, report, counts, row_count, total, timer, profiler=None):
+        if profiler is not None:
+            self._update_field_statistics(profiler)
+            self._update_field_values(profiler)
 
         self.report = report
+        self.report["total"] = total
+        if DIFFERENTIAL_REFRESH:
+            self.report["features"] = counts
+
+        # Time spent by stage, "other" is the time out of the identified stages
+        stages = timer.as_dict()
+        duration = sum(stage["wall"] for stage in stages.values())
+        self.report["stages"] = stages
+        self.report["duration"] = duration
+        self.report["rows_per_second"] = row_count / duration if duration else None
+
         if not row_count:
             self.report["status"] = "Error"
             self.save(update_fields=["report"])
@@ -176,78 +531,345 @@ class Source(PolymorphicModel, CeleryCallMethodsMixin):
 
         if row_count == total:
             self.report["status"] = "success"
-            self.save(update_fields=["report"])
+        self.save(update_fields=["report"])
+
+        if DIFFERENTIAL_REFRESH:
+            return {"count": row_count, "total": total, **counts}
         return {"count": row_count, "total": total}
 
+    def _update_field_statistics(self, profiler):
+        """Store the statistics of the fields, and the type of undefined ones"""
+        statistics = profiler.statistics()
+        fields = list(self.fields.filter(name__in=statistics.keys()))
+        for field in fields:
+            field.statistics = statistics[field.name]
+            if field.data_type == FieldTypes.Undefined.value:
+                field.data_type = FieldTypes[field.statistics["data_type"]].value
+        Field.objects.bulk_update(fields, ["statistics", "data_type"])
+
+    def _update_field_values(self, profiler):
+        """Replace the distinct values of fields, with their count of records"""
+        # Only written records are profiled, and all have the identifier field
+        identifiers = profiler.fields.get(self.id_field)
+        total = identifiers.count if identifiers is not None else 0
+        field_values = []
+        for name, profile in profiler.fields.items():
+            if profile.values is None:
+                continue
+            # Keyed by type too, as 1, 1.0 and True are distinct values
+            values = dict(profile.values)
+            # Records without the field have a null value
+            if total > profile.count:
+                key = ("NoneType", None)
+                values[key] = values.get(key, 0) + total - profile.count
+            field_values += [
+                FieldValue(
+                    source=self,
+                    field=name,
+                    value=value,
+                    text="" if value is None else str(value)[:255],
+                    count=count,
+                )
+                for (_, value), count in values.items()
+            ]
+
+        with transaction.atomic():
+            self.field_values.all().delete()
+            FieldValue.objects.bulk_create(field_values, batch_size=FEATURE_BATCH_SIZE)
+
+    def _import_records(
+        self,
+        layer,
+        records,
+        begin_date,
+        report,
+        counts,
+        seen=None,
+        timer=None,
+        progress=None,
+        profiler=None,
+    ):
+        """Write (index, record) pairs, return the count of read and written ones.
+
+        Identifiers of written and unchanged features are added to seen, and their
+        records to the profiler, if given.
+        """
+        if seen is None:
+            seen = set()
+        if timer is None:
+            timer = StageTimer()
+        if progress is None:
+            progress = ProgressReporter()
+
+        read = 0
+        row_count = 0
+        batch = []
+        collector = self._get_report_collector(report, begin_date)
+
+        for i, row in timer.iterate("read", records):
+            read += 1
+            progress.advance("import")
+            geometry = row.pop(self.SOURCE_GEOM_ATTRIBUTE)
+            try:
+                identifier = row[self.id_field]
+            except KeyError:
+                msg = "Can't find identifier field for this record"
+                collector.add("missing_identifier", msg, line=i)
+                continue
+            if FEATURE_BATCH_CALLBACK or DIFFERENTIAL_REFRESH:
+                batch.append((identifier, geometry, row))
+                if len(batch) >= FEATURE_BATCH_SIZE:
+                    seen |= self._write_features(
+                        layer, batch, begin_date, counts, timer, profiler
+                    )
+                    batch = []
+            else:
+                with timer.stage("write", items=1):
+                    feature = self.update_feature(layer, identifier, geometry, row)
+                if feature is not None:
+                    seen.add(str(identifier))
+                    if profiler is not None:
+                        with timer.stage("profile", items=1):
+                            profiler.add(row)
+            row_count += 1
+        if batch:
+            seen |= self._write_features(
+                layer, batch, begin_date, counts, timer, profiler
+            )
+        collector.flush()
+
+        return read, row_count
+
+    def _clear_features(self, layer, begin_date, counts, identifiers=None, timer=None):
+        if timer is None:
+            timer = StageTimer()
+        with timer.stage("clear") as stage:
+            # Only issues of the last refresh are kept
+            self.issues.exclude(run=begin_date).delete()
+            deleted = self.clear_features(layer, begin_date, identifiers)
+            if isinstance(deleted, tuple):
+                stage["items"] += deleted[0]
+
+            if DIFFERENTIAL_REFRESH:
+                # Features that are not anymore in the source
+                self.feature_hashes.filter(seen_at__lt=begin_date).delete()
+                if isinstance(deleted, tuple):
+                    counts["deleted"] = deleted[0]
+
+    def _write_features(
+        self, layer, features, begin_date, counts, timer, profiler=None
+    ):
+        """Write a batch of features, skipping unchanged ones in differential mode.
+
+        Returns the identifiers of written and unchanged features, whose records
+        are added to the profiler, if given.
+        """
+        batch = features
+        unchanged = set()
+        if DIFFERENTIAL_REFRESH:
+            with timer.stage("hash", items=len(features)):
+                features, hashes, known_hashes, unchanged = self._skip_unchanged(
+                    layer, features, begin_date, counts
+                )
+
+        with timer.stage("write", items=len(features)):
+            if FEATURE_BATCH_CALLBACK:
+                results = self.update_features(layer, features)
+            else:
+                results = [self.update_feature(layer, *feature) for feature in features]
+
+        if DIFFERENTIAL_REFRESH:
+            with timer.stage("hash"):
+                written = {
+                    str(feature[0])
+                    for feature, result in zip(features, results)
+                    if result is not None and hashes[str(feature[0])] is not None
+                }
+                counts["inserted"] += len(written - known_hashes.keys())
+                counts["updated"] += len(written & known_hashes.keys())
+                self.feature_hashes.filter(identifier__in=written).delete()
+                FeatureHash.objects.bulk_create(
+                    [
+                        FeatureHash(
+                            source=self,
+                            identifier=identifier,
+                            hash=hashes[identifier],
+                            seen_at=begin_date,
+                        )
+                        for identifier in written
+                    ]
+                )
+
+        written = unchanged | {
+            str(feature[0])
+            for feature, result in zip(features, results)
+            if result is not None
+        }
+        if profiler is not None:
+            with timer.stage("profile", items=len(batch)):
+                for identifier, _, attributes in batch:
+                    if str(identifier) in written:
+                        profiler.add(attributes)
+        return written
+
+    def _skip_unchanged(self, layer, features, begin_date, counts):
+        """Return features changed since the last refresh, with their hashes"""
+        hashes = {
+            str(identifier): self.get_feature_hash(geometry, attributes)
+            for identifier, geometry, attributes in features
+        }
+        # Hashes of features missing from the layer are ignored, as when the layer
+        # was replaced after a rename of the source, or purged
+        in_layer = layer.features.filter(identifier=OuterRef("identifier"))
+        known_hashes = dict(
+            self.feature_hashes.filter(identifier__in=hashes.keys())
+            .annotate(in_layer=Exists(in_layer))
+            .filter(in_layer=True)
+            .values_list("identifier", "hash")
+        )
+        unchanged = {
+            identifier
+            for identifier, value in hashes.items()
+            if value is not None and known_hashes.get(identifier) == value
+        }
+        # Unchanged features are only marked as seen, to be kept by clear_features
+        self.feature_hashes.filter(identifier__in=unchanged).update(seen_at=begin_date)
+        counts["unchanged"] += len(unchanged)
+        features = [feature for feature in features if str(feature[0]) not in unchanged]
+        return features, hashes, known_hashes, unchanged
+
+    def get_feature_hash(self, geometry, attributes):
+        """Return a digest of the feature content, None if it can't be computed"""
+        try:
+            geometry = GEOSGeometry(geometry).ewkb
+        except (TypeError, ValueError, GEOSException, GDALException):
+            return None
+        properties = json.dumps(attributes, sort_keys=True, cls=DjangoJSONEncoder)
+        return hashlib.sha1(bytes(geometry) + properties.encode()).hexdigest()
+
     @transaction.atomic
     def update_fields(self):
-        records = self._get_records(50)
+        profiler = FieldProfiler(sample_size=self.MAX_SAMPLE_DATA)
+        for record in self._get_records(50):
+            record.pop(self.SOURCE_GEOM_ATTRIBUTE)
+            profiler.add(record)
 
+        existing = {field.name: field for field in self.fields.all()}
         fields = {}
+        collector = ReportCollector(self.report, save=self._save_report)
+
+        for order, (field_name, statistics) in enumerate(profiler.statistics().items()):
+            profile = profiler.fields[field_name]
+            field = existing.get(field_name)
+            if field is None:
+                field = Field(source=self, name=field_name, label=field_name)
+            if field.pk is None or field.data_type == FieldTypes.Undefined.value:
+                field.data_type = FieldTypes[statistics["data_type"]].value
+            field.order = order
+            field.sample = profile.sample
+            field.statistics = statistics
+            fields[field_name] = field
+
+            if profile.undecodable:
+                msg = f"{field_name} couldn't be decoded for source {self.name}"
+                collector.add("undecodable_field", msg, line=order)
+
+        # Fields are written with a constant number of queries, whatever their count
+        created = [field for field in fields.values() if field.pk is None]
+        updated = [field for field in fields.values() if field.pk is not None]
+        with transaction.atomic():
+            collector.flush()
+            Field.objects.bulk_create(created)
+            Field.objects.bulk_update(
+                updated, ["order", "sample", "data_type", "statistics"]
+            )
 
-        for record in records:
-            record.pop(self.SOURCE_GEOM_ATTRIBUTE)
+            # Delete fields that are not anymore present
+            self.fields.exclude(name__in=fields.keys()).delete()
 
-            for i, (field_name, value) in enumerate(record.items()):
-                is_new = False
+        return {"count": len(fields)}
 
-                if field_name not in fields:
-                    field, is_new = self.fields.get_or_create(
-                        name=field_name,
-                        defaults={"label": field_name},
-                    )
-                    field.order = i  # force order for update
-                    field.sample = []
-                    fields[field_name] = field
-
-                if is_new or fields[field_name].data_type == FieldTypes.Undefined:
-                    fields[field_name].data_type = FieldTypes.get_type_from_data(
-                        value
-                    ).value
-
-                if (
-                    len(fields[field_name].sample) < self.MAX_SAMPLE_DATA
-                    and value is not None
-                ):
-
-                    if isinstance(value, bytes):
-                        try:
-                            value = value.decode()
-                        except (UnicodeDecodeError, AttributeError):
-                            msg = f"{field_name} couldn't be decoded for source {self.name}"
-                            self.report["status"] = "Warning"
-                            self.report.setdefault("lines", {}).setdefault(
-                                f"{i}", []
-                            ).append(msg)
-                            self.save()
-                            continue
-
-                    fields[field_name].sample.append(value)
-
-        for field in fields.values():
-            field.save()
-
-        # Delete fields that are not anymore present
-        self.fields.exclude(name__in=fields.keys()).delete()
+    def get_preview(self, limit=PREVIEW_SIZE):
+        """First records of the source and their inferred fields.
 
-        return {"count": len(fields)}
+        Only limit records are read, and the preview is cached until the source is
+        saved again. Geometries are in 4326 projection, as stored in the layer, and
+        fields are typed as by update_fields.
+        """
+        key = f"geosource-preview-{self.pk}-{self.updated_at.timestamp()}-{limit}"
+        preview = cache.get(key)
+        if preview is not None:
+            return preview
 
-    def get_status(self):
-        response = {}
+        records = []
+        profiler = FieldProfiler()
+        for record in self._get_records(limit):
+            geometry = record.pop(self.SOURCE_GEOM_ATTRIBUTE, None)
+            try:
+                geometry = json.loads(to_wgs84(geometry).geojson)
+            except (GEOSException, GDALException, TypeError, ValueError):
+                geometry = None
+            profiler.add(record)
+            records.append({"geometry": geometry, "properties": record})
+
+        preview = {
+            "fields": [
+                {"name": name, "data_type": FieldTypes[profile.data_type].value}
+                for name, profile in profiler.fields.items()
+            ],
+            "records": records,
+        }
+        cache.set(key, preview, PREVIEW_CACHE_TIMEOUT)
+        return preview
 
-        if self.task_id:
-            task = AsyncResult(self.task_id)
-            response = {"state": task.state, "done": task.date_done}
+    def get_status(self, progress=True):
+        """Status of the last task, as stored by the task on the source.
 
-            if task.successful():
-                response["result"] = task.result
-            if task.failed():
-                task_data = task.backend.get(task.backend.get_key_for_task(task.id))
-                response.update(json.loads(task_data).get("result", {}))
+        Only the progress of a running task is read from the result backend.
+        """
+        if not self.task_id:
+            return {}
 
+        if self.task_state is None:
+            # Task launched before task states were stored on sources
+            response = self._get_backend_status()
+        else:
+            response = {"state": self.task_state, "done": self.task_done}
+
+            if self.task_state == states.SUCCESS:
+                response["result"] = self.task_result
+            elif self.task_state in (states.FAILURE, states.STARTED):
+                response.update(self.task_result)
+
+            if progress and self.task_state == states.STARTED:
+                task = AsyncResult(self.task_id)
+                if task.state == PROGRESS_STATE:
+                    response["state"] = PROGRESS_STATE
+                    response["progress"] = task.info
+
+        # The lock is only looked for while a task runs, sparing a query for each
+        # source of the list endpoint
+        response["locked"] = (
+            response["state"] in self.RUNNING_STATES and self.is_refresh_locked()
+        )
         return response
 
-    def _get_records(self, limit=None):
+    def _get_backend_status(self):
+        task = AsyncResult(self.task_id)
+        response = {"state": task.state, "done": task.date_done}
+
+        if task.state == PROGRESS_STATE:
+            response["progress"] = task.info
+
+        if task.successful():
+            response["result"] = task.result
+        if task.failed():
+            task_data = task.backend.get(task.backend.get_key_for_task(task.id))
+            response.update(json.loads(task_data).get("result", {}))
+
+        return response
+
+    def _get_records(self, limit=None, shard=None):
         raise NotImplementedError
 
     def __str__(self):
@@ -268,6 +890,8 @@ class Field(models.Model):
     level = models.IntegerField(default=0)
     sample = JSONField(default=list)
     order = models.IntegerField(default=0)
+    # Profile of the field values, as computed by profiler.FieldProfile
+    statistics = JSONField(default=dict, editable=False, encoder=DjangoJSONEncoder)
 
     def __str__(self):
         return f"{self.name} ({self.source.name} - {self.data_type})"
@@ -277,6 +901,69 @@ class Field(models.Model):
         ordering = ("order",)
 
 
+class FeatureHash(models.Model):
+    """Digest of a feature content as of its last refresh"""
+
+    source = models.ForeignKey(
+        Source, related_name="feature_hashes", on_delete=models.CASCADE
+    )
+    identifier = models.CharField(max_length=255)
+    hash = models.CharField(max_length=40)
+    seen_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.identifier} ({self.source.name})"
+
+    class Meta:
+        unique_together = ["source", "identifier"]
+
+
+class FieldValue(models.Model):
+    """Distinct value of a source field, and its count of records"""
+
+    source = models.ForeignKey(
+        Source, related_name="field_values", on_delete=models.CASCADE
+    )
+    field = models.CharField(max_length=255)
+    value = JSONField(null=True)
+    # Value as text, truncated, for prefix searches
+    text = models.CharField(max_length=255)
+    count = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"{self.field}={self.text} ({self.source.name})"
+
+    class Meta:
+        indexes = [models.Index(fields=["source", "field", "text"])]
+
+
+class IssueSeverity(IntEnum):
+    Warning = 0
+    Error = 1
+
+    @classmethod
+    def choices(cls):
+        return [(enum.value, enum) for enum in cls]
+
+
+class RefreshIssue(models.Model):
+    """Problem met on a record while refreshing a source"""
+
+    source = models.ForeignKey(Source, related_name="issues", on_delete=models.CASCADE)
+    # Beginning date of the refresh
+    run = models.DateTimeField()
+    line = models.PositiveIntegerField(null=True)
+    severity = models.IntegerField(choices=IssueSeverity.choices())
+    kind = models.CharField(max_length=50)
+    message = models.TextField()
+
+    def __str__(self):
+        return f"{self.kind} line {self.line} ({self.source.name})"
+
+    class Meta:
+        indexes = [models.Index(fields=["source", "run", "line"])]
+
+
 class PostGISSource(Source):
     db_host = models.CharField(
         max_length=255,
@@ -292,14 +979,19 @@ class PostGISSource(Source):
 
     refresh = models.IntegerField(default=-1)
 
+    # The query has no guaranteed order, records skipped by a resumed refresh could
+    # be others than those already written
+    CAN_RESUME_REFRESH = False
+
     @property
     def SOURCE_GEOM_ATTRIBUTE(self):
         return self.geom_field
 
     @property
     def _db_connection(self):
+        """Connection to the source database, from the pool, to be released to it"""
         try:
-            conn = psycopg2.connect(
+            return pool.getconn(
                 user=self.db_username,
                 password=self.db_password,
                 host=self.db_host,
@@ -311,20 +1003,39 @@ class PostGISSource(Source):
             self.report.setdefault("message", []).append(err.args[0])
             self.save()
             raise
-        return conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
-    def _get_records(self, limit=None):
-        cursor = self._db_connection
+    def _get_shard_records(self, shard):
+        # Rows have no order, they are numbered across shards so lines don't collide
+        for i, record in enumerate(self._get_records(shard=shard)):
+            yield i * self.shards + shard, record
+
+    def _get_records(self, limit=None, shard=None):
+        conn = self._db_connection
 
         query = "SELECT * FROM ({}) q "
         attrs = [sql.SQL(self.query)]
+        if shard is not None:
+            query += "WHERE MOD(ABS(HASHTEXT({}::text)::bigint), {}) = {} "
+            attrs += [
+                sql.Identifier("q", self.id_field),
+                sql.Literal(self.shards),
+                sql.Literal(shard),
+            ]
         if limit:
             query += "LIMIT {}"
             attrs.append(sql.Literal(limit))
 
-        cursor.execute(sql.SQL(query).format(*attrs))
-
-        return cursor
+        try:
+            # A named cursor is kept server side, rows are fetched by chunks of
+            # itersize while iterating
+            with conn.cursor(
+                "geosource_records", cursor_factory=psycopg2.extras.RealDictCursor
+            ) as cursor:
+                cursor.itersize = POSTGIS_ITERSIZE
+                cursor.execute(sql.SQL(query).format(*attrs))
+                yield from cursor
+        finally:
+            pool.putconn(conn)
 
 
 class GeoJSONSource(Source):
@@ -340,80 +1051,90 @@ class GeoJSONSource(Source):
             self.save()
             raise
 
-    def _get_records(self, limit=None):
-        geojson = self.get_file_as_dict()
-
-        limit = limit if limit else len(geojson["features"])
+    def _get_records(self, limit=None, shard=None):
+        with self.file.open("rb") as fileobj:
+            features = iter_geojson_features(fileobj)
 
-        records = []
-        for i, record in enumerate(geojson["features"][:limit]):
             try:
-                records.append(
-                    {
-                        self.SOURCE_GEOM_ATTRIBUTE: GEOSGeometry(
-                            json.dumps(record["geometry"])
-                        ),
+                for i, record in enumerate(islice(features, limit)):
+                    properties = record.get("properties") or {}
+                    if shard is not None and not self.in_shard(properties, shard):
+                        yield None
+                        continue
+                    try:
+                        with self.refresh_stage("parse", items=1):
+                            geometry = geometry_from_mapping(
+                                record["geometry"], srid=4326
+                            )
+                    except (ValueError, GDALException):
+                        msg = "The record geometry seems invalid."
+                        collector = ReportCollector(self.report, save=self._save_report)
+                        collector.add("invalid_geometry", msg, line=i)
+                        collector.flush()
+                        raise ValueError(msg)
+
+                    yield {
+                        self.SOURCE_GEOM_ATTRIBUTE: geometry,
                         **record["properties"],
                     }
-                )
-            except (ValueError, GDALException):
-                msg = "The record geometry seems invalid."
-                self.report["status"] = "Warning"
-                self.report.setdefault("line", {}).setdefault(f"{i}", []).append(msg)
+            except json.JSONDecodeError:
+                msg = "Source's GeoJSON file is not valid"
+                self.report["status"] = "Error"
+                self.report.setdefault("message", []).append(msg)
                 self.save()
-                raise ValueError(msg)
-
-        return records
+                raise
 
 
 class ShapefileSource(Source):
     # Zipped ShapeFile
     file = models.FileField(upload_to="geosource/shapefile/%Y/")
 
-    def _get_records(self, limit=None):
-        with fiona.BytesCollection(self.file.read()) as shapefile:
-            limit = limit if limit else len(shapefile)
-
-            # Detect the EPSG
-            _, srid = shapefile.crs.get("init", "epsg:4326").split(":")
-
-            # Return geometries with a hack to set the correct geometry srid
-            return [
-                {
-                    self.SOURCE_GEOM_ATTRIBUTE: GEOSGeometry(
-                        GEOSGeometry(json.dumps(feature.get("geometry"))).wkt,
-                        srid=int(srid),
-                    ),
-                    **feature.get("properties", {}),
-                }
-                for feature in shapefile[:limit]
-            ]
+    def _get_records(self, limit=None, shard=None):
+        with local_file_path(self.file, suffix=".zip") as path:
+            with fiona.open(f"zip://{path}") as shapefile:
+                # Detect the EPSG
+                _, srid = shapefile.crs.get("init", "epsg:4326").split(":")
+
+                for feature in islice(shapefile, limit):
+                    properties = feature.get("properties", {})
+                    if shard is not None and not self.in_shard(properties, shard):
+                        yield None
+                        continue
+                    with self.refresh_stage("parse", items=1):
+                        geometry = geometry_from_mapping(
+                            feature.get("geometry"), srid=int(srid)
+                        )
+                    yield {self.SOURCE_GEOM_ATTRIBUTE: geometry, **properties}
 
 
 class CommandSource(Source):
     command = models.CharField(max_length=255)
 
-    @transaction.atomic
-    def refresh_data(self):
-        layer = self.get_layer()
-        begin_date = datetime.now()
+    CAN_BE_SHARDED = False
 
-        try:
-            # wheter we are in a celery task ?
-            if isinstance(sys.stdout, LoggingProxy):
-                # Hack to be able to launch command with mondrian logging
-                sys.stdout.buffer = BytesIO()
-                sys.stdout.encoding = None
-                sys.stderr.buffer = BytesIO()
-                sys.stderr.encoding = None
-        except AttributeError:
-            pass
+    def refresh_data(self):
+        # The lock is released out of the transaction, which may be aborted
+        with self.refresh_lock(), transaction.atomic():
+            layer = self.get_layer()
+            begin_date = datetime.now()
 
-        call_command(self.command)
+            try:
+                # wheter we are in a celery task ?
+                if isinstance(sys.stdout, LoggingProxy):
+                    # Hack to be able to launch command with mondrian logging
+                    sys.stdout.buffer = BytesIO()
+                    sys.stdout.encoding = None
+                    sys.stderr.buffer = BytesIO()
+                    sys.stderr.encoding = None
+            except AttributeError:
+                pass
+
+            call_command(self.command)
 
-        self.clear_features(layer, begin_date)
+            self.clear_features(layer, begin_date)
 
-        refresh_data_done.send_robust(sender=self.__class__, layer=layer.pk)
+        # Sets last_refresh, which the property values ETag depends on
+        self._refresh_done()
 
         return {"count": None}
 
@@ -427,7 +1148,9 @@ class WMTSSource(Source):
     tile_size = models.IntegerField()
     url = LongURLField()
 
-    def get_status(self):
+    CAN_BE_SHARDED = False
+
+    def get_status(self, progress=True):
         return {"state": "DONT_NEED"}
 
     def refresh_data(self):
@@ -469,64 +1192,103 @@ class CSVSource(Source):
             err.args = (msg,)  # new message for the user
             raise
 
-    def _get_records(self, limit=None):
-        sheet = self.get_file_as_sheet()
-        if self.settings.get("use_header"):
-            sheet.name_columns_by_row(0)
+    def _iter_rows(self):
+        """Yield the rows of the CSV file one by one, without loading the file"""
+        separator = self._get_separator(self.settings["field_separator"])
+        quotechar = self._get_separator(self.settings["char_delimiter"])
+        with local_file_path(self.file) as path:
+            reader = None
+            try:
+                # pyexcel.iget_array would leave the file open until
+                # pyexcel.free_resources, which closes all the opened files
+                sheets, reader = pyexcel_io.iget_data(
+                    path,
+                    delimiter=separator,
+                    encoding=self.settings["encoding"],
+                    quotechar=quotechar,
+                    start_row=self.settings.get("number_lines_to_ignore") or 0,
+                )
+                yield from next(iter(sheets.values()), [])
+            # Exception is raised if no parser found
+            except (pyexcel.exceptions.FileTypeNotSupported, Exception) as err:
+                msg = "Provided CSV file is invalid"
+                self.report["status"] = "Error"
+                self.report.setdefault("message", []).append(msg)
+                self.save()
+                err.args = (msg,)  # new message for the user
+                raise
+            finally:
+                if reader is not None:
+                    reader.close()
 
+    def _get_records(self, limit=None, shard=None):
+        width = 0
         ignored_columns = []
         if self.settings.get("ignore_columns"):
-            ignored_columns = self._get_null_columns_indexes(sheet)
+            width, ignored_columns = self._get_null_columns_indexes(cached=bool(limit))
 
-        limit = limit if limit else len(sheet)
+        rows = self._iter_rows()
+        colnames = []
+        if self.settings.get("use_header"):
+            colnames = make_names_unique(next(rows, []))
+            width = len(colnames)
+
+        # Invalid coordinate fields are reported once, before reading the rows
+        if self.settings["coordinates_field"] == "two_columns":
+            coord_fields = (
+                self._get_field_index(colnames, self.settings["longitude_field"]),
+                self._get_field_index(colnames, self.settings["latitude_field"]),
+            )
+        else:
+            coord_fields = (
+                self._get_field_index(colnames, self.settings["latlong_field"]),
+            )
+        ignored_field = (*coord_fields, *ignored_columns)
+        # Blank lines and short rows are padded, so their coordinates are empty
+        width = max(width, *[index + 1 for index in coord_fields])
 
-        records = []
         srid = self._get_srid()
         row_count = 0
         total = 0
-        for i, row in enumerate(sheet):
-            total += 1
-            if self.settings["coordinates_field"] == "two_columns":
-                lat_field = self.settings["latitude_field"]
-                lng_field = self.settings["longitude_field"]
-
-                x, y = self._extract_coordinates(
-                    row, sheet.colnames, [lng_field, lat_field]
-                )
-                ignored_field = (row.index(x), row.index(y), *ignored_columns)
-            else:
-                lnglat_field = self.settings["latlong_field"]
+        collector = self._get_report_collector()
+        try:
+            for i, row in enumerate(rows):
+                total += 1
+                if len(row) < width:
+                    row = [*row, *[""] * (width - len(row))]
+
+                cells = self._get_cells(colnames, row, ignored_field)
+                if shard is not None and not self.in_shard(cells, shard):
+                    yield None
+                    continue
+
                 try:
-                    x, y = self._extract_coordinates(
-                        row, sheet.colnames, [lnglat_field]
-                    )
+                    x, y = self._extract_coordinates(row, coord_fields)
                 except ValueError:
+                    # Coordinates not split in two by the separator
+                    if shard is not None:
+                        # Each row is given, so shards number records alike
+                        yield None
                     continue
-                coord_fields = (
-                    (sheet.colnames.index(lnglat_field),)
-                    if self.settings.get("use_header")
-                    else (int(lnglat_field),)
-                )
-                ignored_field = (*coord_fields, *ignored_columns)
 
-            cells = self._get_cells(sheet, row, ignored_field)
-            try:
-                records.append(
-                    {
-                        self.SOURCE_GEOM_ATTRIBUTE: GEOSGeometry(
-                            f"Point({x} {y})", srid=srid
-                        ),
-                        **cells,
-                    }
-                )
-            except (ValueError, GDALException):
-                msg = f"One of source's record has invalid geometry: Point({x} {y}) srid={srid}"
-                self.report["status"] = "Warning"
-                self.report.setdefault("message", []).append(msg)
-                self.save()
-                # raise ValueError(msg)
-                continue
-            row_count += 1
+                try:
+                    with self.refresh_stage("parse", items=1):
+                        geometry = GEOSGeometry(f"Point({x} {y})", srid=srid)
+                except (ValueError, GDALException, GEOSException):
+                    msg = f"One of source's record has invalid geometry: Point({x} {y}) srid={srid}"
+                    collector.add("invalid_geometry", msg, line=i)
+                    if shard is not None:
+                        yield None
+                    continue
+                row_count += 1
+                yield {self.SOURCE_GEOM_ATTRIBUTE: geometry, **cells}
+
+                if limit and row_count >= limit:
+                    rows.close()
+                    return
+        finally:
+            collector.flush()
+
         if not row_count:
             self.report["status"] = "Error"
             self.report.setdefault("message", []).append(
@@ -534,27 +1296,23 @@ class CSVSource(Source):
             )
         elif row_count == total:
             self.report["status"] = "Success"
-        return records
 
-    def _extract_coordinates(self, row, colnames, fields):
-        coords = []
-        for field in fields:
-            # if no header, we expect index for the columns has been provided
-            try:
-                field_index = (
-                    colnames.index(field)
-                    if self.settings.get("use_header")
-                    else int(field)
-                )
-            except ValueError as err:
-                msg = f"{field} is not a valid coordinate field"
-                self.report["status"] = "Warning"
-                self.report.setdefault("message", []).append(msg)
-                self.save()
-                err.args = (msg,)
-                raise
-            c = row[field_index]
-            coords.append(c)
+    def _get_field_index(self, colnames, field):
+        # if no header, we expect index for the columns has been provided
+        try:
+            return (
+                colnames.index(field) if self.settings.get("use_header") else int(field)
+            )
+        except ValueError as err:
+            msg = f"{field} is not a valid coordinate field"
+            self.report["status"] = "Warning"
+            self.report.setdefault("message", []).append(msg)
+            self.save()
+            err.args = (msg,)
+            raise
+
+    def _extract_coordinates(self, row, indexes):
+        coords = [row[index] for index in indexes]
         if len(coords) == 2:
             x, y = coords
         else:
@@ -571,14 +1329,37 @@ class CSVSource(Source):
 
         return (x, y)
 
-    def _get_null_columns_indexes(self, sheet):
-        null_columns_indexes = []
-        for i, column in enumerate(sheet.column):
-            non_empty_cells = [cell for cell in column if cell != ""]
-            (len(non_empty_cells) == 0) and null_columns_indexes.append(i)
-        return null_columns_indexes
+    def _get_null_columns_indexes(self, cached=False):
+        """Return the columns count and indexes of the columns without any value.
 
-    def _get_cells(self, sheet, row, ingored_columns):
+        Finding empty columns reads the whole file, so the result of the last full
+        read can be used instead, for the same file and settings. Without it, the
+        first preview still reads the whole file.
+        """
+        signature = json.dumps(
+            [self.file.name, self.file.size, self.settings], sort_keys=True
+        )
+        key = f"geosource-null-columns-{hashlib.sha1(signature.encode()).hexdigest()}"
+        result = cache.get(key) if cached else None
+        if result is None:
+            result = self._find_null_columns_indexes()
+            cache.set(key, result, NULL_COLUMNS_CACHE_TIMEOUT)
+        return result
+
+    def _find_null_columns_indexes(self):
+        with closing(self._iter_rows()) as rows:
+            colnames = next(rows, []) if self.settings.get("use_header") else []
+            width = len(colnames)
+            non_empty_columns = set()
+            for row in rows:
+                width = max(width, len(row))
+                non_empty_columns.update(i for i, cell in enumerate(row) if cell != "")
+                if colnames and len(non_empty_columns) >= width:
+                    # every column has a value, no need to read further
+                    break
+        return width, [i for i in range(width) if i not in non_empty_columns]
+
+    def _get_cells(self, colnames, row, ingored_columns):
         if not self.settings.get("use_header"):
             # records names are the column index when no header was provided
             # casting to str to avoid issue (e.i id_field)
@@ -590,7 +1371,7 @@ class CSVSource(Source):
 
         return {
             name: self._format_cell_value(value)
-            for i, (name, value) in enumerate(zip(sheet.colnames, row))
+            for i, (name, value) in enumerate(zip(colnames, row))
             if i not in ingored_columns
         }
 
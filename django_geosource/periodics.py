@@ -1,18 +1,114 @@
 import logging
+import operator
+from collections import Counter
+from datetime import timedelta
+from functools import partial, reduce
+
+from celery import states
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from django_geosource.app_settings import (
+    MAX_TASK_RUNTIME,
+    REFRESH_AGING,
+    REFRESH_CONCURRENCY,
+    REFRESH_CONCURRENCY_PER_TYPE,
+)
 from django_geosource.models import Source
 
 logger = logging.getLogger(__name__)
 
 
+def get_running_filter(now):
+    """Filter of sources with a task running, not blocked for too long.
+
+    Methods holding the refresh lock only run while it is held, so a source left
+    started by a killed worker is not running anymore.
+    """
+    locked = RawSQL(
+        """
+        SELECT objid::bigint FROM pg_locks
+        WHERE locktype = 'advisory' AND classid = %s AND objsubid = 2
+        AND database = (SELECT oid FROM pg_database WHERE datname = current_database())
+        """,
+        [Source.REFRESH_LOCK_NAMESPACE],
+    )
+    locking_task = Q(task_state=states.STARTED) & reduce(
+        operator.or_,
+        (
+            Q(task_result__contains={"action": method})
+            for method in Source.LOCKED_METHODS
+        ),
+    )
+    return (
+        Q(task_state__in=states.UNREADY_STATES)
+        & Q(task_date__gte=now - timedelta(hours=MAX_TASK_RUNTIME))
+        & (~locking_task | Q(pk__in=locked))
+    )
+
+
+def get_refresh_cost(source, now=None):
+    """Expected cost of a refresh, from the duration and size of the previous one.
+
+    Given the current date, the time the source is overdue is deducted from the
+    duration, weighted by REFRESH_AGING.
+    """
+    duration = source.report.get("duration") or 0
+    if now is not None and source.next_refresh_at is not None:
+        duration -= REFRESH_AGING * (now - source.next_refresh_at).total_seconds()
+    return (duration, source.report.get("total") or 0)
+
+
+def claim_due_sources():
+    """Return sources due for a refresh, and postpone their next refresh.
+
+    Cheapest sources are claimed first, the longer overdue ones being considered
+    cheaper, as long as refresh slots are free. Sources
+    are locked with SKIP LOCKED, so concurrent schedulers claim distinct sources.
+    Their next refresh is set again by their refresh once done.
+    """
+    now = timezone.now()
+    running = get_running_filter(now)
+    with transaction.atomic():
+        running_types = Counter(
+            ContentType.objects.get_for_id(ctype).model_class().__name__
+            for ctype in Source.objects.filter(running).values_list(
+                "polymorphic_ctype", flat=True
+            )
+        )
+        slots = None
+        if REFRESH_CONCURRENCY is not None:
+            slots = REFRESH_CONCURRENCY - sum(running_types.values())
+
+        due = (
+            Source.objects.filter(next_refresh_at__lte=now)
+            .exclude(running)
+            .select_for_update(skip_locked=True)
+        )
+        sources = []
+        for source in sorted(due, key=partial(get_refresh_cost, now=now)):
+            if slots is not None and len(sources) >= slots:
+                break
+            source_type = source.__class__.__name__
+            type_limit = REFRESH_CONCURRENCY_PER_TYPE.get(source_type)
+            if type_limit is not None and running_types[source_type] >= type_limit:
+                continue
+            running_types[source_type] += 1
+            sources.append(source)
+
+        Source.objects.filter(pk__in=[source.pk for source in sources]).update(
+            next_refresh_at=now + timedelta(hours=MAX_TASK_RUNTIME)
+        )
+    return sources
+
+
 def auto_refresh_source():
-    countdown = 0
-    for source in Source.objects.all():
-        logger.info(f"Is refresh for {source}<{source.id}> needed?")
-        if source.should_refresh():
-            logger.info(f"Schedule refresh for source {source}<{source.id}>...")
-            # Delay execution by some minutes to avoid struggling
-            try:
-                source.run_async_method("refresh_data", countdown=countdown, force=True)
-                countdown += 60 * 3
-            except Exception:
-                logger.exception("Failed to refresh source!")
+    """Start due refreshes in free slots, it runs again once a refresh ends"""
+    for source in claim_due_sources():
+        logger.info(f"Schedule refresh for source {source}<{source.id}>...")
+        try:
+            source.run_async_method("refresh_data", force=True)
+        except Exception:
+            logger.exception("Failed to refresh source!")
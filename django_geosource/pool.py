@@ -0,0 +1,170 @@
+"""Pool of connections to the databases of PostGIS sources.
+
+Connections are kept by server, database and user, so sources of the same database
+reuse them, whether they are refreshed or validated. Each process has its own
+connections, the pool being reset in forked processes.
+"""
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.pool import PoolError
+
+from .app_settings import (
+    POSTGIS_POOL_IDLE_TIMEOUT,
+    POSTGIS_POOL_SIZE,
+    POSTGIS_POOL_TIMEOUT,
+)
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        max_size=POSTGIS_POOL_SIZE,
+        idle_timeout=POSTGIS_POOL_IDLE_TIMEOUT,
+        timeout=POSTGIS_POOL_TIMEOUT,
+    ):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._condition = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        # Idle connections by key, with the time they were released
+        self._idle = {}
+        # Count of connections by key, idle or not
+        self._sizes = {}
+        # Keys of the connections in use, by their id
+        self._keys = {}
+
+    def _get_key(self, host, port, dbname, user, password):
+        # Connections opened with another password are not reused
+        digest = hashlib.sha1((password or "").encode()).hexdigest()
+        return (host, int(port or 5432), dbname, user, digest)
+
+    def getconn(self, host, port, dbname, user, password):
+        """Return an idle connection to the database, else open a new one.
+
+        PoolError is raised if the max size is reached and no connection is
+        released within the timeout.
+        """
+        key = self._get_key(host, port, dbname, user, password)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._condition:
+                if self._pid != os.getpid():
+                    # Connections of the parent process must not be shared
+                    self._reset()
+                conn = self._take_idle(key, deadline)
+                if conn is None:
+                    self._sizes[key] = self._sizes.get(key, 0) + 1
+                    break
+            # Checked out of the lock, not to block the other threads on the server
+            if self._is_healthy(conn):
+                with self._condition:
+                    self._keys[id(conn)] = key
+                return conn
+            with self._condition:
+                self._discard(key, conn)
+                self._condition.notify()
+
+        try:
+            conn = psycopg2.connect(
+                host=host, port=port, dbname=dbname, user=user, password=password
+            )
+        except Exception:
+            with self._condition:
+                self._sizes[key] -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._keys[id(conn)] = key
+        return conn
+
+    def putconn(self, conn):
+        """Release a connection got from the pool, it is closed if broken"""
+        with self._condition:
+            key = self._keys.pop(id(conn), None)
+        if key is None:
+            # Got before a fork, or already released
+            return
+        try:
+            if not conn.closed:
+                conn.rollback()
+        except psycopg2.Error:
+            pass
+        with self._condition:
+            if conn.closed or conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                self._discard(key, conn)
+            else:
+                self._idle.setdefault(key, []).append((conn, time.monotonic()))
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self, host, port, dbname, user, password):
+        conn = self.getconn(host, port, dbname, user, password)
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def clear(self):
+        """Close all idle connections"""
+        with self._condition:
+            for key, idle in self._idle.items():
+                for conn, _ in idle:
+                    self._discard(key, conn)
+            self._idle = {}
+            self._condition.notify_all()
+
+    def _take_idle(self, key, deadline):
+        """Pop an idle connection, waiting for one while the max size is reached.
+
+        None is returned when a new connection may be opened instead.
+        """
+        while True:
+            self._close_expired()
+            idle = self._idle.get(key)
+            if idle:
+                conn, _ = idle.pop()
+                return conn
+            if self._sizes.get(key, 0) < self.max_size:
+                return None
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise PoolError("Connection pool exhausted")
+            self._condition.wait(remaining)
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def _close_expired(self):
+        expiry = time.monotonic() - self.idle_timeout
+        for key, idle in self._idle.items():
+            for conn, released_at in [item for item in idle if item[1] < expiry]:
+                idle.remove((conn, released_at))
+                self._discard(key, conn)
+
+    def _discard(self, key, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        self._sizes[key] -= 1
+
+
+pool = ConnectionPool()
@@ -0,0 +1,267 @@
+"""Statistics of source fields, computed while reading records.
+
+Each field keeps a bounded state, whatever the number of records: type votes,
+null count, a k minimum values sketch to estimate the distinct count, min and max
+values, and frequent values counted with the Misra-Gries algorithm. Its distinct
+values are also counted exactly, until there are more than FIELD_VALUES_LIMIT.
+States are JSON serializable, and can be merged, so shards and chunks of a
+refresh can be profiled separately.
+"""
+import heapq
+import zlib
+from collections import Counter
+from datetime import date
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .app_settings import FIELD_VALUES_LIMIT
+
+# Number of hashes kept to estimate distinct counts, the error is about 1/sqrt(k)
+DISTINCT_SKETCH_SIZE = 256
+# Number of values counted to find the most frequent ones
+FREQUENT_COUNTERS = 20
+# Number of most frequent values returned by statistics
+TOP_VALUES = 5
+# Frequent values are truncated to bound memory
+MAX_VALUE_LENGTH = 100
+# Types of the values counted as is, others are counted JSON encoded
+JSON_TYPES = (str, int, float, bool, type(None))
+
+
+def get_value_type(value):
+    """Name of the FieldTypes member of a non null value, None if unknown"""
+    if isinstance(value, bool):
+        return "Boolean"
+    if isinstance(value, int):
+        return "Integer"
+    if isinstance(value, float):
+        return "Float"
+    if isinstance(value, date):
+        return "Date"
+    if isinstance(value, str):
+        # Cheap check before parsing, as most strings are not dates
+        if 8 <= len(value) <= 35 and value[:4].isdigit() and value[4:5] == "-":
+            try:
+                if parse_date(value) or parse_datetime(value):
+                    return "Date"
+            except ValueError:
+                pass
+        return "String"
+    return None
+
+
+class FieldProfile:
+    def __init__(self, state=None, sample_size=0):
+        state = state or {}
+        self.count = state.get("count", 0)
+        self.nulls = state.get("nulls", 0)
+        self.undecodable = state.get("undecodable", 0)
+        self.types = Counter(state.get("types", {}))
+        # Negated hashes, so the heap top is the largest of the smallest hashes
+        self.hashes = [-h for h in state.get("hashes", [])]
+        heapq.heapify(self.hashes)
+        self.hash_set = set(state.get("hashes", []))
+        self.bounds = state.get("bounds", {})
+        self.frequent = Counter(state.get("frequent", {}))
+        self.sample = state.get("sample", [])
+        self.sample_size = sample_size
+        # Count by (type name, value), so 1, 1.0 and True are distinct values
+        self.values = None
+        if state.get("values", []) is not None:
+            self.values = Counter(
+                {
+                    (type(value).__name__, value): count
+                    for value, count in state.get("values", [])
+                }
+            )
+
+    def add(self, value):
+        self.count += 1
+        value_type = None
+        if isinstance(value, bytes):
+            try:
+                value = value.decode()
+            except UnicodeDecodeError:
+                self.undecodable += 1
+                return
+        elif value is not None and value != "":
+            value_type = get_value_type(value)
+
+        self._add_value(value)
+        if value is None or value == "":
+            self.nulls += 1
+            return
+
+        if value_type is not None:
+            self.types[value_type] += 1
+            self._add_bound(value_type, value)
+
+        if len(self.sample) < self.sample_size:
+            self.sample.append(value)
+
+        text = str(value)[:MAX_VALUE_LENGTH]
+        self._add_hash(zlib.crc32(text.encode()))
+        self._add_frequent(text)
+
+    def _add_value(self, value, count=1):
+        if self.values is None:
+            return
+        if not isinstance(value, JSON_TYPES):
+            # Encoded as in feature properties, like dates in ISO 8601
+            try:
+                value = DjangoJSONEncoder().default(value)
+            except (TypeError, ValueError):
+                value = str(value)
+        key = (type(value).__name__, value)
+        if key in self.values or len(self.values) < FIELD_VALUES_LIMIT:
+            self.values[key] += count
+        else:
+            # Too many distinct values to be all kept
+            self.values = None
+
+    def _add_bound(self, value_type, value):
+        kind = "number" if value_type in ("Integer", "Float") else "text"
+        if kind == "text":
+            value = value.isoformat() if isinstance(value, date) else str(value)
+        bounds = self.bounds.get(kind)
+        if bounds is None:
+            self.bounds[kind] = [value, value]
+        elif value < bounds[0]:
+            bounds[0] = value
+        elif value > bounds[1]:
+            bounds[1] = value
+
+    def _add_hash(self, value):
+        if value in self.hash_set:
+            return
+        if len(self.hashes) < DISTINCT_SKETCH_SIZE:
+            heapq.heappush(self.hashes, -value)
+            self.hash_set.add(value)
+        elif value < -self.hashes[0]:
+            removed = -heapq.heapreplace(self.hashes, -value)
+            self.hash_set.discard(removed)
+            self.hash_set.add(value)
+
+    def _add_frequent(self, text, count=1):
+        if text in self.frequent or len(self.frequent) < FREQUENT_COUNTERS:
+            self.frequent[text] += count
+            return
+        # Every counter is decremented, and those at zero are dropped
+        decrement = min(count, min(self.frequent.values()))
+        for key in list(self.frequent):
+            self.frequent[key] -= decrement
+            if self.frequent[key] <= 0:
+                del self.frequent[key]
+        if count > decrement:
+            self._add_frequent(text, count - decrement)
+
+    def merge(self, other):
+        self.count += other.count
+        self.nulls += other.nulls
+        self.undecodable += other.undecodable
+        self.types.update(other.types)
+        for kind, (low, high) in other.bounds.items():
+            self._add_bound_pair(kind, low, high)
+        for value in other.hash_set:
+            self._add_hash(value)
+        for text, count in other.frequent.items():
+            self._add_frequent(text, count)
+        if other.values is None:
+            self.values = None
+        else:
+            for (_, value), count in other.values.items():
+                self._add_value(value, count)
+        missing = self.sample_size - len(self.sample)
+        self.sample.extend(other.sample[:missing])
+
+    def _add_bound_pair(self, kind, low, high):
+        bounds = self.bounds.get(kind)
+        if bounds is None:
+            self.bounds[kind] = [low, high]
+        else:
+            bounds[0] = min(bounds[0], low)
+            bounds[1] = max(bounds[1], high)
+
+    @property
+    def data_type(self):
+        if not self.types:
+            return "Undefined"
+        if set(self.types) == {"Integer", "Float"}:
+            return "Float"
+        return self.types.most_common(1)[0][0]
+
+    @property
+    def distinct(self):
+        if len(self.hashes) < DISTINCT_SKETCH_SIZE:
+            return len(self.hashes)
+        # The k-th smallest of uniform hashes is about k / distinct of the range
+        return round((DISTINCT_SKETCH_SIZE - 1) * 2**32 / (-self.hashes[0] + 1))
+
+    def as_state(self):
+        return {
+            "count": self.count,
+            "nulls": self.nulls,
+            "undecodable": self.undecodable,
+            "types": dict(self.types),
+            "hashes": sorted(self.hash_set),
+            "bounds": self.bounds,
+            "frequent": dict(self.frequent),
+            "sample": self.sample,
+            "values": None
+            if self.values is None
+            else [[value, count] for (_, value), count in self.values.items()],
+        }
+
+    def statistics(self):
+        data_type = self.data_type
+        bounds = self.bounds.get(
+            "number" if data_type in ("Integer", "Float") else "text", [None, None]
+        )
+        return {
+            "data_type": data_type,
+            "types": dict(self.types),
+            "count": self.count,
+            "null_ratio": self.nulls / self.count if self.count else None,
+            "distinct": self.distinct,
+            "min": bounds[0],
+            "max": bounds[1],
+            "top": [
+                {"value": value, "count": count}
+                for value, count in self.frequent.most_common(TOP_VALUES)
+            ],
+        }
+
+
+class FieldProfiler:
+    """Profile the fields of records, in the order they are first seen"""
+
+    def __init__(self, state=None, sample_size=0):
+        self.sample_size = sample_size
+        self.fields = {
+            name: FieldProfile(field_state, sample_size)
+            for name, field_state in (state or {}).items()
+        }
+
+    def add(self, record):
+        for name, value in record.items():
+            profile = self.fields.get(name)
+            if profile is None:
+                profile = self.fields[name] = FieldProfile(sample_size=self.sample_size)
+            profile.add(value)
+
+    def merge(self, state):
+        """Add the fields of another profiler, given by its as_state"""
+        for name, field_state in state.items():
+            other = FieldProfile(field_state)
+            if name in self.fields:
+                self.fields[name].merge(other)
+            else:
+                self.fields[name] = other
+                other.sample_size = self.sample_size
+
+    def as_state(self):
+        return {name: profile.as_state() for name, profile in self.fields.items()}
+
+    def statistics(self):
+        return {name: profile.statistics() for name, profile in self.fields.items()}
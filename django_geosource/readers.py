@@ -0,0 +1,274 @@
+import codecs
+import json
+import os
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+from contextlib import contextmanager
+
+from django.contrib.gis.gdal import CoordTransform, SpatialReference
+from django.contrib.gis.geos import GEOSGeometry
+
+CHUNK_SIZE = 64 * 1024
+WHITESPACES = " \t\n\r"
+# Chars continuing a number, after its beginning
+NUMBER_CHARS = set("0123456789.eE+-")
+
+# WKB is written in native byte order, as coordinates are packed with array
+WKB_BYTE_ORDER = b"\x01" if sys.byteorder == "little" else b"\x00"
+WKB_Z_FLAG = 0x80000000
+WKB_TYPES = {
+    "Point": 1,
+    "LineString": 2,
+    "Polygon": 3,
+    "MultiPoint": 4,
+    "MultiLineString": 5,
+    "MultiPolygon": 6,
+    "GeometryCollection": 7,
+}
+# Depth of the coordinates nesting, 0 is a position
+COORDINATES_DEPTHS = {
+    "Point": 0,
+    "LineString": 1,
+    "Polygon": 2,
+    "MultiPoint": 1,
+    "MultiLineString": 2,
+    "MultiPolygon": 3,
+}
+
+# Coordinate transformations are costly to set up and not thread safe, so they are
+# cached by source SRID for each thread
+_transforms = threading.local()
+
+
+class JSONStream:
+    """Incremental reader of a JSON document from a file object.
+
+    Values are decoded one at a time with ``json.JSONDecoder.raw_decode``, so only
+    the value being decoded needs to be held in memory.
+    """
+
+    decoder = json.JSONDecoder()
+
+    def __init__(self, fileobj, chunk_size=CHUNK_SIZE):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.text_decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self.data = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size=None):
+        chunk = self.fileobj.read(size or self.chunk_size)
+        while isinstance(chunk, bytes):
+            raw, chunk = chunk, self.text_decoder.decode(chunk, final=not chunk)
+            if not chunk and raw:
+                # Only the beginning of a multibyte char has been read
+                chunk = self.fileobj.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        consumed = self.pos
+        self.data = self.data[consumed:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next significant char, without consuming it"""
+        while True:
+            while self.pos < len(self.data) and self.data[self.pos] in WHITESPACES:
+                self.pos += 1
+            if self.pos < len(self.data):
+                return self.data[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, *chars):
+        char = self.peek()
+        if char not in chars or not char:
+            expected = " or ".join(f"'{c}'" for c in chars)
+            raise json.JSONDecodeError(f"Expecting {expected}", self.data, self.pos)
+        self.pos += 1
+        return char
+
+    def decode(self):
+        """Decode and return the next JSON value"""
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.data, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                end = None
+            if (
+                end is not None
+                and not self.eof
+                and isinstance(value, (int, float))
+                and set(self.data[end:]) <= NUMBER_CHARS
+            ):
+                # Only the beginning of the number may have been read, as "12" of
+                # "12.75" when the buffer ends with "12."
+                end = None
+            # A value ending with the buffer may be truncated (i.e. numbers)
+            if end is not None and (end < len(self.data) or self.eof):
+                self.pos = end
+                return value
+            # Grow reads with the buffer so a big value is not decoded too many times
+            self.fill(max(size, len(self.data) - self.pos))
+            size *= 2
+
+
+def iter_geojson_features(fileobj, chunk_size=CHUNK_SIZE):
+    """Yield the features of a GeoJSON FeatureCollection one by one"""
+    stream = JSONStream(fileobj, chunk_size)
+
+    stream.expect("{")
+    if stream.peek() == "}":
+        return
+
+    while True:
+        key = stream.decode()
+        if not isinstance(key, str):
+            raise json.JSONDecodeError(
+                "Expecting property name enclosed in double quotes",
+                stream.data,
+                stream.pos,
+            )
+        stream.expect(":")
+
+        if key == "features":
+            stream.expect("[")
+            if stream.peek() == "]":
+                stream.expect("]")
+            else:
+                while True:
+                    yield stream.decode()
+                    if stream.expect(",", "]") == "]":
+                        break
+        else:
+            stream.decode()
+
+        if stream.expect(",", "}") == "}":
+            return
+
+
+@contextmanager
+def local_file_path(fieldfile, suffix=None):
+    """Give a path on the local filesystem to the content of a FileField.
+
+    The stored file is used directly when possible, else it is copied by chunks to
+    a temporary file, for storages without local path or files not saved yet. The
+    temporary file keeps the extension of the file, unless a suffix is given.
+    """
+    try:
+        path = fieldfile.path if fieldfile._committed else None
+    except NotImplementedError:
+        path = None
+
+    if path:
+        yield path
+        return
+
+    if suffix is None:
+        suffix = os.path.splitext(fieldfile.name)[1]
+
+    with tempfile.NamedTemporaryFile(suffix=suffix) as tmp:
+        for chunk in fieldfile.chunks():
+            tmp.write(chunk)
+        tmp.flush()
+        yield tmp.name
+
+
+def _first_position(mapping):
+    if mapping["type"] == "GeometryCollection":
+        return _first_position(mapping["geometries"][0])
+    position = mapping["coordinates"]
+    for i in range(COORDINATES_DEPTHS[mapping["type"]]):
+        position = position[0]
+    return position
+
+
+def _wkb_header(geom_type, dim):
+    code = WKB_TYPES[geom_type] | (WKB_Z_FLAG if dim == 3 else 0)
+    return WKB_BYTE_ORDER + struct.pack("=I", code)
+
+
+def _wkb_positions(positions, dim):
+    values = array("d")
+    for position in positions:
+        if len(position) != dim:
+            raise ValueError("Mixed coordinates dimensions")
+        values.extend(position)
+    return struct.pack("=I", len(positions)) + values.tobytes()
+
+
+def _wkb_rings(rings, dim):
+    return struct.pack("=I", len(rings)) + b"".join(
+        _wkb_positions(ring, dim) for ring in rings
+    )
+
+
+def _wkb(mapping, dim):
+    geom_type = mapping["type"]
+    header = _wkb_header(geom_type, dim)
+
+    if geom_type == "GeometryCollection":
+        parts = [_wkb(geometry, dim) for geometry in mapping["geometries"]]
+        return header + struct.pack("=I", len(parts)) + b"".join(parts)
+
+    coordinates = mapping["coordinates"]
+    if geom_type == "Point":
+        return header + _wkb_positions([coordinates], dim)[4:]
+    if geom_type == "LineString":
+        return header + _wkb_positions(coordinates, dim)
+    if geom_type == "Polygon":
+        return header + _wkb_rings(coordinates, dim)
+
+    part_type = geom_type.replace("Multi", "")
+    parts = [
+        _wkb({"type": part_type, "coordinates": part}, dim) for part in coordinates
+    ]
+    return header + struct.pack("=I", len(parts)) + b"".join(parts)
+
+
+def geometry_from_mapping(mapping, srid=None):
+    """Build a GEOSGeometry from a GeoJSON like geometry mapping.
+
+    The geometry is packed to WKB instead of being serialized to JSON and parsed
+    again by GDAL. Unusual geometries (empty, mixed dimensions, etc.) still go
+    through GDAL, so they are parsed and rejected the same way.
+    """
+    try:
+        dim = len(_first_position(mapping))
+        if dim not in (2, 3):
+            raise ValueError("Unsupported coordinates dimension")
+        wkb = _wkb(mapping, dim)
+    except (KeyError, IndexError, TypeError, ValueError):
+        geometry = GEOSGeometry(json.dumps(mapping))
+        if srid:
+            geometry.srid = srid
+        return geometry
+
+    return GEOSGeometry(memoryview(wkb), srid=srid)
+
+
+def to_wgs84(geometry):
+    """Return a GEOSGeometry of geometry in 4326 projection"""
+    geom = GEOSGeometry(geometry)
+    if geom.srid and geom.srid > 0 and geom.srid != 4326:
+        transform = getattr(_transforms, str(geom.srid), None)
+        if transform is None:
+            transform = CoordTransform(
+                SpatialReference(geom.srid), SpatialReference(4326)
+            )
+            setattr(_transforms, str(geom.srid), transform)
+        geom.transform(transform)
+        geom.srid = 4326
+    else:
+        # Errors for geometries without SRID are left to GEOS
+        geom.transform(4326)
+    return geom
@@ -0,0 +1,77 @@
+import time
+
+from .app_settings import FEATURE_BATCH_SIZE, REPORT_SAMPLE_SIZE, REPORT_SAVE_INTERVAL
+
+
+class ReportCollector:
+    """Add warnings and errors to a source report, with a bounded size.
+
+    Occurrences are counted by kind in the report `occurrences`, but only the
+    first REPORT_SAMPLE_SIZE messages and lines of each kind are kept. The
+    report is saved by the save callback, at most every REPORT_SAVE_INTERVAL
+    seconds, and when flushed.
+
+    With an issues callback, every occurrence is given to it as a (kind, message,
+    line, status) tuple, by batches of FEATURE_BATCH_SIZE, and lines are not kept
+    in the report.
+    """
+
+    def __init__(self, report, save=None, issues=None, interval=REPORT_SAVE_INTERVAL):
+        self.report = report
+        self.save = save
+        self.write_issues = issues
+        self.issues = []
+        self.interval = interval
+        self.saved_at = time.monotonic()
+        self.changed = False
+
+    def add(self, kind, message, line=None, status="Warning"):
+        self.report["status"] = status
+        occurrences = self.report.setdefault("occurrences", {})
+        occurrences[kind] = occurrences.get(kind, 0) + 1
+        if occurrences[kind] <= REPORT_SAMPLE_SIZE:
+            self.report.setdefault("message", []).append(message)
+            if line is not None and self.write_issues is None:
+                self.report.setdefault("lines", {}).setdefault(f"{line}", []).append(
+                    message
+                )
+        self.changed = True
+
+        if self.write_issues is not None:
+            self.issues.append((kind, message, line, status))
+            if len(self.issues) >= FEATURE_BATCH_SIZE:
+                self.write_issues(self.issues)
+                self.issues = []
+        if time.monotonic() - self.saved_at >= self.interval:
+            self.flush()
+
+    def merge(self, report):
+        """Add the messages of another report, keeping samples bounded"""
+        if "status" in report:
+            self.report["status"] = report["status"]
+        if "occurrences" not in report:
+            return
+        occurrences = self.report.setdefault("occurrences", {})
+        for kind, count in report["occurrences"].items():
+            occurrences[kind] = occurrences.get(kind, 0) + count
+
+        limit = REPORT_SAMPLE_SIZE * len(occurrences)
+        messages = self.report.setdefault("message", [])
+        missing = max(limit - len(messages), 0)
+        messages.extend(report.get("message", [])[:missing])
+        lines = self.report.setdefault("lines", {})
+        for line, line_messages in report.get("lines", {}).items():
+            if len(lines) >= limit:
+                break
+            lines.setdefault(line, []).extend(line_messages)
+        self.changed = True
+
+    def flush(self):
+        """Write pending issues, then save the report if it changed"""
+        if self.issues:
+            self.write_issues(self.issues)
+            self.issues = []
+        if self.changed and self.save is not None:
+            self.save()
+        self.saved_at = time.monotonic()
+        self.changed = False
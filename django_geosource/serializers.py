@@ -25,10 +25,12 @@ from .models import (
     GeoJSONSource,
     GeometryTypes,
     PostGISSource,
+    RefreshIssue,
     ShapefileSource,
     Source,
     WMTSSource,
 )
+from .pool import pool
 
 
 class PolymorphicModelSerializer(ModelSerializer):
@@ -107,7 +109,13 @@ class FieldSerializer(ModelSerializer):
     class Meta:
         model = Field
         exclude = ("source",)
-        read_only_fields = ("name", "sample", "source")
+        read_only_fields = ("name", "sample", "source", "statistics")
+
+
+class RefreshIssueSerializer(ModelSerializer):
+    class Meta:
+        model = RefreshIssue
+        exclude = ("source",)
 
 
 class SourceSerializer(PolymorphicModelSerializer):
@@ -116,7 +124,7 @@ class SourceSerializer(PolymorphicModelSerializer):
     slug = SlugField(max_length=255, read_only=True)
 
     class Meta:
-        fields = "__all__"
+        exclude = ("refresh_checkpoint",)
         model = Source
 
     def _update_fields(self, source):
@@ -134,6 +142,8 @@ class SourceSerializer(PolymorphicModelSerializer):
     @transaction.atomic
     def update(self, instance, validated_data):
         validated_data.pop("fields")
+        # An interrupted refresh can't be resumed with another configuration
+        instance.refresh_checkpoint = {}
 
         source = super().update(instance, validated_data)
 
@@ -183,25 +193,23 @@ class PostGISSourceSerializer(SourceSerializer):
     geom_field = CharField(required=False, allow_null=True)
 
     def _get_connection(self, data):
-        conn = psycopg2.connect(
+        return pool.connection(
             user=data.get("db_username"),
             password=data.get("db_password"),
             host=data.get("db_host"),
             port=data.get("db_port", 5432),
             dbname=data.get("db_name"),
         )
-        return conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
     def _first_record(self, data):
-        cursor = self._get_connection(data)
         query = "SELECT * FROM ({}) q LIMIT 1"
-        cursor.execute(sql.SQL(query).format(sql.SQL(data["query"])))
-        return cursor.fetchone()
+        with self._get_connection(data) as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+                cursor.execute(sql.SQL(query).format(sql.SQL(data["query"])))
+                return cursor.fetchone()
 
-    def _validate_geom(self, data):
+    def _validate_geom(self, data, first_record):
         """Validate that geom_field exists else try to find it in source"""
-        first_record = self._first_record(data)
-
         if data.get("geom_field") is None:
             for k, v in first_record.items():
                 try:
@@ -222,22 +230,23 @@ class PostGISSourceSerializer(SourceSerializer):
 
     def _validate_query_connection(self, data):
         """Check if connection informations are valid or not, trying to
-        connect to the Pg server and executing the query
+        connect to the Pg server and executing the query, and return its first
+        record
         """
         try:
-            self._first_record(data)
+            return self._first_record(data)
         except Exception:
             raise ValidationError("Connection informations or query are not valid")
 
     def validate(self, data):
-        self._validate_query_connection(data)
-        data = self._validate_geom(data)
+        first_record = self._validate_query_connection(data)
+        data = self._validate_geom(data, first_record)
 
         return super().validate(data)
 
     class Meta:
         model = PostGISSource
-        fields = "__all__"
+        exclude = ("refresh_checkpoint",)
         extra_kwargs = {"db_password": {"write_only": True}}
 
 
@@ -261,7 +270,7 @@ class FileSourceSerializer(SourceSerializer):
 class GeoJSONSourceSerializer(FileSourceSerializer):
     class Meta:
         model = GeoJSONSource
-        fields = "__all__"
+        exclude = ("refresh_checkpoint",)
         extra_kwargs = {"file": {"write_only": True}}
 
     def _validate_field_infos(self, data):
@@ -277,7 +286,7 @@ class GeoJSONSourceSerializer(FileSourceSerializer):
         except TypeError:
             return  # file field is empty in update no get_records
         try:
-            records = instance._get_records(1)
+            records = list(instance._get_records(1))
         except Exception as err:
             raise ValidationError(err.args[0])
 
@@ -298,14 +307,14 @@ class GeoJSONSourceSerializer(FileSourceSerializer):
 class ShapefileSourceSerializer(FileSourceSerializer):
     class Meta:
         model = ShapefileSource
-        fields = "__all__"
+        exclude = ("refresh_checkpoint",)
         extra_kwargs = {"file": {"write_only": True}}
 
 
 class CommandSourceSerializer(SourceSerializer):
     class Meta:
         model = CommandSource
-        fields = "__all__"
+        exclude = ("refresh_checkpoint",)
         extra_kwargs = {"command": {"read_only": True}}
 
 
@@ -318,7 +327,7 @@ class WMTSSourceSerialize(SourceSerializer):
 
     class Meta:
         model = WMTSSource
-        fields = "__all__"
+        exclude = ("refresh_checkpoint",)
 
     def validate(self, data):
         # We do not use validate_url hook method
@@ -360,7 +369,7 @@ class CSVSourceSerializer(FileSourceSerializer):
 
     class Meta:
         model = CSVSource
-        fields = "__all__"
+        exclude = ("refresh_checkpoint",)
         extra_kwargs = {
             "file": {"write_only": True},
         }
@@ -430,7 +439,7 @@ class CSVSourceSerializer(FileSourceSerializer):
         # create an instance without saving data
         instance = self.Meta.model(**data_copy)
         try:
-            records = instance._get_records(1)
+            records = list(instance._get_records(1))
         except (ValueError, GDALException) as err:
             raise ValidationError(err.args[0])
 
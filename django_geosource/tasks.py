@@ -1,46 +1,106 @@
 import logging
+import time
 
-from celery import shared_task, states
+from celery import current_task, shared_task, states
 from celery.exceptions import Ignore
 from django.apps import apps
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .app_settings import PROGRESS_INTERVAL
 
 logger = logging.getLogger(__name__)
 
+PROGRESS_STATE = "PROGRESS"
+
+
+class ProgressReporter:
+    """Publish the progress of the running celery task, throttled by time.
+
+    Nothing is published when not running in a task.
+    """
+
+    def __init__(self, total=None, done=0, interval=PROGRESS_INTERVAL):
+        self.total = total
+        self.done = done
+        self.interval = interval
+        self.start_done = done
+        self.start = self.last = time.monotonic()
+
+    def advance(self, stage, items=1):
+        self.done += items
+        self.publish(stage)
+
+    def publish(self, stage, force=False):
+        now = time.monotonic()
+        if not force and now - self.last < self.interval:
+            return
+        self.last = now
+
+        task = current_task
+        if task is None or not task.request.id:
+            return
+
+        eta = None
+        elapsed = now - self.start
+        rate = (self.done - self.start_done) / elapsed if elapsed else 0
+        if self.total and rate:
+            eta = max(self.total - self.done, 0) / rate
+
+        task.update_state(
+            state=PROGRESS_STATE,
+            meta={"done": self.done, "total": self.total, "stage": stage, "eta": eta},
+        )
+
 
 def set_failure_state(task, method, message):
 
     # Failure messaging needs to be formed as expected by celery API
     logger.warning(message)
-    task.update_state(
-        state=states.FAILURE,
-        meta={
-            "method": method,
-            "exc_type": Exception.__name__,
-            "exc_message": [message],
-        },
+    meta = {
+        "method": method,
+        "exc_type": Exception.__name__,
+        "exc_message": [message],
+    }
+    task.update_state(state=states.FAILURE, meta=meta)
+    return meta
+
+
+def save_task_state(Model, pk, task_id, state, result=None):
+    """Store the task state on the object, if the task is still its current one"""
+    Model.objects.filter(pk=pk, task_id=task_id).update(
+        task_state=state,
+        task_done=None if state in states.UNREADY_STATES else timezone.now(),
+        task_result=result or {},
     )
 
 
-@shared_task(bind=True)
-def run_model_object_method(self, app, model, pk, method, success_state=states.SUCCESS):
-    self.update_state(state=states.STARTED)
+def call_model_object_method(task, app, model, pk, method, success_state, *args):
+    task.update_state(state=states.STARTED)
 
     Model = apps.get_app_config(app).get_model(model)
+    save_task_state(Model, pk, task.request.id, states.STARTED, {"action": method})
 
+    state = states.FAILURE
     try:
         obj = Model.objects.get(pk=pk)
 
         logger.info(f"Call method {method} on {obj}")
-        state = {"action": method, **getattr(obj, method)()}
+        meta = {"action": method, **getattr(obj, method)(*args)}
         logger.info(f"Method {method} on {obj} ended")
 
-        self.update_state(state=success_state, meta=state)
+        task.update_state(state=success_state, meta=meta)
+        state = success_state
 
     except Model.DoesNotExist:
-        set_failure_state(self, method, f"{Model}'s object with pk {pk} doesn't exist")
+        meta = set_failure_state(
+            task, method, f"{Model}'s object with pk {pk} doesn't exist"
+        )
 
     except AttributeError as e:
-        set_failure_state(self, method, f"{method} doesn't exist for object {obj}: {e}")
+        meta = set_failure_state(
+            task, method, f"{method} doesn't exist for object {obj}: {e}"
+        )
         logger.error(e, exc_info=True)
 
     except Exception as e:
@@ -48,13 +108,68 @@ def run_model_object_method(self, app, model, pk, method, success_state=states.S
             message = e.message
         else:
             message = f"{e}"
-        set_failure_state(self, method, message)
+        meta = set_failure_state(task, method, message)
         logger.error(e, exc_info=True)
 
+    save_task_state(Model, pk, task.request.id, state, meta)
+    if method in ("refresh_data", "finish_refresh"):
+        # A refresh slot is free, the next due source can start
+        run_auto_refresh_source.delay()
     raise Ignore()
 
 
 @shared_task(bind=True)
+def run_model_object_method(self, app, model, pk, method, success_state=states.SUCCESS):
+    call_model_object_method(self, app, model, pk, method, success_state)
+
+
+@shared_task
+def refresh_source_shard(app, model, pk, shard, begin_date):
+    """Import one shard of a source, its result is given to finish_source_refresh"""
+    Model = apps.get_app_config(app).get_model(model)
+    obj = Model.objects.get(pk=pk)
+
+    logger.info(f"Refresh shard {shard} of {obj}")
+    return obj.refresh_shard(shard, parse_datetime(begin_date))
+
+
+@shared_task(bind=True)
+def finish_source_refresh(self, results, app, model, pk, begin_date):
+    """Final step of a sharded refresh, once all its shards are imported"""
+    call_model_object_method(
+        self,
+        app,
+        model,
+        pk,
+        "finish_refresh",
+        states.SUCCESS,
+        results,
+        parse_datetime(begin_date),
+    )
+
+
+@shared_task
+def fail_source_refresh(request, exc, traceback, app, model, pk):
+    """Error callback of a sharded refresh, when one of its shards failed"""
+    Model = apps.get_app_config(app).get_model(model)
+    meta = {
+        "action": "finish_refresh",
+        "exc_type": type(exc).__name__,
+        "exc_message": [f"{exc}"],
+    }
+    logger.warning(f"Sharded refresh of {model} {pk} failed: {exc}")
+    # The request is the one of finish_source_refresh, whose id is the source task
+    save_task_state(Model, pk, request.id, states.FAILURE, meta)
+
+    try:
+        obj = Model.objects.get(pk=pk)
+    except Model.DoesNotExist:
+        return
+    obj._refresh_done()
+    run_auto_refresh_source.delay()
+
+
+@shared_task
 def run_auto_refresh_source():
     from django_geosource.periodics import auto_refresh_source
 
@@ -6,13 +6,16 @@ from django.contrib.auth import get_user_model
 from django.contrib.gis.geos import GEOSGeometry
 from django.test import TestCase
 from django.urls import reverse
+from django.utils import timezone
 from django_geosource.models import (
     CommandSource,
     Field,
     FieldTypes,
     GeoJSONSource,
     GeometryTypes,
+    IssueSeverity,
     PostGISSource,
+    RefreshIssue,
     ShapefileSource,
     Source,
 )
@@ -20,6 +23,7 @@ from rest_framework.status import (
     HTTP_200_OK,
     HTTP_201_CREATED,
     HTTP_202_ACCEPTED,
+    HTTP_304_NOT_MODIFIED,
     HTTP_400_BAD_REQUEST,
     HTTP_500_INTERNAL_SERVER_ERROR,
 )
@@ -202,6 +206,7 @@ class ModelSourceViewsetTestCase(TestCase):
             reverse("geosource:geosource-detail", args=[source.pk])
         )
         self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertNotIn("refresh_checkpoint", response.json())
 
         test_field_label = "New Test Label"
 
@@ -387,3 +392,98 @@ class ModelSourceViewsetTestCase(TestCase):
                 ),
             )
             self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+
+    def test_preview(self):
+        url = reverse("geosource:geosource-preview", args=[self.source_geojson.pk])
+        with patch.object(
+            GeoJSONSource, "_get_records", wraps=self.source_geojson._get_records
+        ) as mocked:
+            response = self.client.get(url, {"limit": 5})
+            self.client.get(url, {"limit": 5})
+
+        # The preview is cached
+        mocked.assert_called_once_with(5)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(
+            response.json()["fields"],
+            [
+                {"name": "id", "data_type": FieldTypes.Integer.value},
+                {"name": "test", "data_type": FieldTypes.Integer.value},
+            ],
+        )
+        record = response.json()["records"][0]
+        self.assertEqual(record["properties"], {"id": 1, "test": 5})
+        self.assertEqual(record["geometry"]["type"], "Point")
+
+        response = self.client.get(url, {"limit": "many"})
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+
+    def test_issues(self):
+        run = timezone.now()
+        RefreshIssue.objects.bulk_create(
+            RefreshIssue(
+                source=self.source_geojson,
+                run=run,
+                line=line,
+                severity=IssueSeverity.Warning.value,
+                kind="missing_identifier",
+                message="Can't find identifier field for this record",
+            )
+            for line in range(3)
+        )
+        RefreshIssue.objects.create(
+            source=self.source_geojson,
+            run=run,
+            line=3,
+            severity=IssueSeverity.Error.value,
+            kind="invalid_geometry",
+            message="The record geometry seems invalid.",
+        )
+        url = reverse("geosource:geosource-issues", args=[self.source_geojson.pk])
+
+        response = self.client.get(url, {"page_size": 2})
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.json()["count"], 4)
+        self.assertEqual(
+            [issue["line"] for issue in response.json()["results"]], [0, 1]
+        )
+
+        response = self.client.get(url, {"severity": IssueSeverity.Error.value})
+        self.assertEqual(response.json()["count"], 1)
+        self.assertEqual(response.json()["results"][0]["kind"], "invalid_geometry")
+
+        response = self.client.get(
+            url, {"kind": "missing_identifier", "run": run.isoformat()}
+        )
+        self.assertEqual(response.json()["count"], 3)
+
+        response = self.client.get(url, {"severity": "error"})
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+        response = self.client.get(url, {"run": "yesterday"})
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+
+    def test_property_values_indexed(self):
+        self.source_geojson.refresh_data()
+        url = reverse(
+            "geosource:geosource-property-values", args=[self.source_geojson.pk]
+        )
+
+        with patch("django_geosource.models.Source.get_layer") as mocked:
+            response = self.client.get(url, {"property": "test"})
+            self.assertEqual(response.json(), [5])
+
+            response = self.client.get(url, {"property": "test", "page": 1})
+            self.assertEqual(response.json()["count"], 1)
+            self.assertEqual(response.json()["results"], [{"value": 5, "count": 1}])
+
+            response = self.client.get(url, {"property": "test", "search": "6"})
+            self.assertEqual(response.json(), [])
+
+        # Values are not read from the layer
+        mocked.assert_not_called()
+
+        etag = response["ETag"]
+        response = self.client.get(
+            url, {"property": "test", "search": "6"}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, HTTP_304_NOT_MODIFIED)
@@ -1,9 +1,12 @@
+import json
 import os
+from io import StringIO
 from unittest import mock
 
 from django.core.management import call_command
 from django.test import TestCase
-from django_geosource.models import GeoJSONSource, GeometryTypes
+from django_geosource.models import GeoJSONSource, GeometryTypes, Source
+from geostore.models import Feature
 from rest_framework.exceptions import MethodNotAllowed
 
 
@@ -86,3 +89,21 @@ class ResyncAllSourcesTestCase(TestCase):
             ):
                 call_command("resync_all_sources", force=True)
         mocked.assert_called_once()
+
+
+class BenchmarkRefreshTestCase(TestCase):
+    def test_benchmark_single_source(self):
+        for source_type in ("geojson", "csv", "csv_one_column", "shapefile"):
+            with self.subTest(source_type=source_type):
+                out = StringIO()
+                call_command(
+                    "benchmark_refresh", single=(source_type, "20"), stdout=out
+                )
+                result = json.loads(out.getvalue())
+
+                self.assertGreater(result["refresh_data"]["queries"], 0)
+                self.assertGreater(result["features_per_second"], 0)
+                self.assertGreater(result["peak_rss_mb"], 0)
+                # Generated sources are removed
+                self.assertFalse(Source.objects.exists())
+                self.assertFalse(Feature.objects.exists())
@@ -4,6 +4,7 @@ from unittest import mock
 from django.contrib.auth.models import Group
 from django.contrib.gis.geos import GEOSGeometry
 from django.test import TestCase
+from django.utils import timezone
 from django_geosource import geostore_callbacks
 from django_geosource.models import GeoJSONSource, GeometryTypes
 from geostore.models import Feature, Layer
@@ -60,6 +61,66 @@ class GeostoreCallBacksTestCase(TestCase):
                     source, layer, "id", "Not a Point", {"property": "Hola"}
                 )
 
+    def test_features_callback(self):
+        source = GeoJSONSource.objects.create(
+            name="test",
+            geom_type=GeometryTypes.Point.value,
+            file=os.path.join(os.path.dirname(__file__), "data", "test.geojson"),
+        )
+        layer = Layer.objects.create(name="test")
+        existing = Feature.objects.create(
+            layer=layer, identifier="1", geom=GEOSGeometry("POINT (0 0)")
+        )
+        with mock.patch("django_geosource.geostore_callbacks.logger.warning"):
+            features = geostore_callbacks.features_callback(
+                source,
+                layer,
+                [
+                    (1, GEOSGeometry("POINT (1 1)", srid=4326), {"name": "updated"}),
+                    (2, GEOSGeometry("POINT (0 0)", srid=3857), {"name": "created"}),
+                    (3, "Not a Point", {"name": "ignored"}),
+                ],
+            )
+
+        self.assertEqual(features[0].pk, existing.pk)
+        self.assertIsNone(features[2])
+        self.assertEqual(layer.features.count(), 2)
+        existing.refresh_from_db()
+        self.assertEqual(existing.properties, {"name": "updated"})
+        self.assertEqual(existing.geom.coords, (1, 1))
+        created = layer.features.get(identifier="2")
+        self.assertEqual(created.geom.srid, 4326)
+        self.assertEqual(created.properties, {"name": "created"})
+
+    def test_features_callback_relations(self):
+        source = GeoJSONSource.objects.create(
+            name="test",
+            geom_type=GeometryTypes.Point.value,
+            file=os.path.join(os.path.dirname(__file__), "data", "test.geojson"),
+        )
+        layer = Layer.objects.create(name="test")
+        existing = Feature.objects.create(
+            layer=layer, identifier="1", geom=GEOSGeometry("POINT (0 0)")
+        )
+        with mock.patch.object(
+            geostore_callbacks.geostore_settings, "GEOSTORE_RELATION_CELERY_ASYNC", True
+        ), mock.patch(
+            "django_geosource.geostore_callbacks.execute_async_func"
+        ) as mocked:
+            features = geostore_callbacks.features_callback(
+                source,
+                layer,
+                [
+                    (1, GEOSGeometry("POINT (1 1)", srid=4326), {}),
+                    (2, GEOSGeometry("POINT (2 2)", srid=4326), {}),
+                ],
+            )
+
+        self.assertEqual(
+            sorted(call.args[1] for call in mocked.call_args_list),
+            sorted([(existing.pk,), (features[1].pk,)]),
+        )
+
     def test_clean_features(self):
         group = Group.objects.create(name="Group")
         source = GeoJSONSource.objects.create(
@@ -72,6 +133,47 @@ class GeostoreCallBacksTestCase(TestCase):
         Feature.objects.create(layer=layer, geom=GEOSGeometry("POINT (0 0)"))
         geostore_callbacks.clear_features(source, layer, layer.updated_at)
 
+    def test_clear_features_with_identifiers(self):
+        source = GeoJSONSource.objects.create(
+            name="test",
+            geom_type=GeometryTypes.Point.value,
+            file=os.path.join(os.path.dirname(__file__), "data", "test.geojson"),
+        )
+        layer = Layer.objects.create(name="test")
+        for identifier in ("1", "2", "3"):
+            Feature.objects.create(
+                layer=layer, identifier=identifier, geom=GEOSGeometry("POINT (0 0)")
+            )
+
+        deleted, _ = geostore_callbacks.clear_features(
+            source, layer, timezone.now(), identifiers={"1", "3"}
+        )
+
+        self.assertEqual(deleted, 1)
+        self.assertEqual(
+            sorted(layer.features.values_list("identifier", flat=True)), ["1", "3"]
+        )
+
+    @mock.patch("django_geosource.geostore_callbacks.CLEAR_FEATURES_CHUNK_SIZE", 2)
+    def test_clear_features_by_chunks(self):
+        source = GeoJSONSource.objects.create(
+            name="test",
+            geom_type=GeometryTypes.Point.value,
+            file=os.path.join(os.path.dirname(__file__), "data", "test.geojson"),
+        )
+        layer = Layer.objects.create(name="test")
+        for identifier in range(5):
+            Feature.objects.create(
+                layer=layer, identifier=identifier, geom=GEOSGeometry("POINT (0 0)")
+            )
+
+        deleted, _ = geostore_callbacks.clear_features(
+            source, layer, timezone.now(), identifiers=[]
+        )
+
+        self.assertEqual(deleted, 5)
+        self.assertFalse(layer.features.exists())
+
     def test_delete_layer(self):
         group = Group.objects.create(name="Group")
         source = GeoJSONSource.objects.create(
@@ -52,7 +52,7 @@ class CSVSourceExceptionsTestCase(TestCase):
         )
         msg = "X is not a valid coordinate field"
         with self.assertRaisesMessage(ValueError, msg):
-            source._get_records()
+            list(source._get_records())
             self.assertIn(msg, source.report.get("message", []))
 
     def test_csv_with_wrong_y_coord(self):
@@ -74,7 +74,7 @@ class CSVSourceExceptionsTestCase(TestCase):
         )
         msg = "Y is not a valid coordinate field"
         with self.assertRaisesMessage(ValueError, msg):
-            source._get_records()
+            list(source._get_records())
             self.assertIn(msg, source.report.get("message", []))
 
     def test_invalid_csv_file_raise_value_error(self):
@@ -99,7 +99,7 @@ class CSVSourceExceptionsTestCase(TestCase):
         with self.assertRaisesMessage(
             (pyexcel.exceptions.FileTypeNotSupported, Exception), msg
         ):
-            source._get_records()
+            list(source._get_records())
             self.assertIn(msg, source.report.get("message", []))
 
     def test_invalid_coordinate_format_raise_error(self):
@@ -120,10 +120,11 @@ class CSVSourceExceptionsTestCase(TestCase):
                 "coordinates_field_count": "xy",
             },
         )
-        source._get_records()
-        self.assertIn(
-            "coordxy is not a valid coordinate field", source.report["message"]
-        )
+        msg = "coordxy is not a valid coordinate field"
+        with self.assertRaisesMessage(ValueError, msg):
+            list(source._get_records())
+        # Reported once, not for each row
+        self.assertEqual(source.report["message"].count(msg), 1)
 
     def test_coordinates_system_without_digit_srid_raise_value_error(self):
         source = CSVSource.objects.create(
@@ -143,7 +144,7 @@ class CSVSourceExceptionsTestCase(TestCase):
             },
         )
         with self.assertRaises(ValueError):
-            source._get_records()
+            list(source._get_records())
 
     def test_coordinates_systems_malformed_raise_index_error(self):
         source = CSVSource.objects.create(
@@ -163,7 +164,7 @@ class CSVSourceExceptionsTestCase(TestCase):
             },
         )
         with self.assertRaises(IndexError):
-            source._get_records()
+            list(source._get_records())
 
     def test_invalid_id_field_raise_value_error_when_refreshing_data(self):
         source = CSVSource.objects.create(
@@ -4,19 +4,30 @@ from io import StringIO
 from unittest import mock
 
 from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.gis.geos import GEOSGeometry
+from django.db import ProgrammingError, connection, connections
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django_geosource import geostore_callbacks
 from django_geosource.models import (
     CommandSource,
     CSVSource,
     Field,
+    FieldTypes,
     GeoJSONSource,
     GeometryTypes,
     PostGISSource,
+    RefreshIssue,
     ShapefileSource,
     Source,
     WMTSSource,
 )
-from geostore.models import Layer
+from django_geosource.pool import pool
+from geostore.models import Feature, Layer
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from rest_framework.exceptions import MethodNotAllowed
 
 
 class MockBackend(object):
@@ -107,6 +118,215 @@ class ModelSourceTestCase(TestCase):
         with self.assertRaisesRegexp(Exception, "Failed to refresh data"):
             self.geojson_source.refresh_data()
 
+    @mock.patch("django_geosource.models.FEATURE_BATCH_SIZE", 1)
+    @mock.patch(
+        "django_geosource.models.FEATURE_BATCH_CALLBACK",
+        "django_geosource.geostore_callbacks.features_callback",
+    )
+    def test_refresh_data_by_batches(self):
+        with mock.patch(
+            "django_geosource.geostore_callbacks.features_callback",
+            wraps=geostore_callbacks.features_callback,
+        ) as mocked:
+            result = self.geojson_source.refresh_data()
+
+        mocked.assert_called_once()
+        self.assertEqual(result, {"count": 1, "total": 1})
+        self.assertEqual(Feature.objects.get().properties, {"id": 1, "test": 5})
+
+    def test_refresh_data_field_statistics(self):
+        Field.objects.create(source=self.geojson_source, name="test")
+        self.geojson_source.refresh_data()
+
+        field = self.geojson_source.fields.get()
+        self.assertEqual(field.data_type, FieldTypes.Integer.value)
+        self.assertEqual(field.statistics["count"], 1)
+        self.assertEqual(field.statistics["distinct"], 1)
+        self.assertEqual((field.statistics["min"], field.statistics["max"]), (5, 5))
+
+    def test_refresh_data_field_values_types(self):
+        records = [
+            {"_geom_": f"SRID=4326;POINT ({i} {i})", "id": i, "value": value}
+            for i, value in enumerate([1, 1.0, True, 1])
+        ]
+        with mock.patch.object(GeoJSONSource, "_get_records", return_value=records):
+            self.geojson_source.refresh_data()
+
+        values = self.geojson_source.field_values.filter(field="value")
+        self.assertEqual(
+            sorted(
+                (repr(value), count)
+                for value, count in values.values_list("value", "count")
+            ),
+            [("1", 2), ("1.0", 1), ("True", 1)],
+        )
+
+    def test_refresh_data_rejected_not_profiled(self):
+        # Records ignored by the callback, as for an invalid geometry
+        with mock.patch(
+            "django_geosource.geostore_callbacks.feature_callback", return_value=None
+        ):
+            self.geojson_source.refresh_data()
+
+        self.assertFalse(self.geojson_source.field_values.exists())
+
+    def test_refresh_data_report_stages(self):
+        self.geojson_source.refresh_data()
+
+        report = self.geojson_source.report
+        self.assertEqual(
+            set(report["stages"]),
+            {"read", "parse", "profile", "reproject", "write", "clear", "other"},
+            report,
+        )
+        self.assertEqual(report["stages"]["read"]["items"], 1)
+        self.assertEqual(report["stages"]["parse"]["items"], 1)
+        self.assertEqual(report["stages"]["reproject"]["items"], 1)
+        self.assertEqual(report["stages"]["write"]["items"], 1)
+        self.assertAlmostEqual(
+            report["duration"], sum(s["wall"] for s in report["stages"].values())
+        )
+        self.assertGreater(report["rows_per_second"], 0)
+
+    def test_refresh_data_clear_features_not_seen(self):
+        with mock.patch(
+            "django_geosource.geostore_callbacks.clear_features",
+            wraps=geostore_callbacks.clear_features,
+        ) as mocked:
+            self.geojson_source.refresh_data()
+
+        self.assertEqual(mocked.call_args[1], {"identifiers": {"1"}})
+
+    def test_refresh_data_clear_features_without_identifiers(self):
+        def clear_features(geosource, layer, begin_date):
+            return layer.features.filter(updated_at__lt=begin_date).delete()
+
+        # Callbacks not supporting identifiers are still called
+        with mock.patch(
+            "django_geosource.geostore_callbacks.clear_features", clear_features
+        ):
+            result = self.geojson_source.refresh_data()
+
+        self.assertEqual(result["count"], 1)
+
+    @mock.patch("django_geosource.models.DIFFERENTIAL_REFRESH", True)
+    def test_differential_refresh(self):
+        result = self.geojson_source.refresh_data()
+        self.assertEqual(result["inserted"], 1)
+        self.assertEqual(self.geojson_source.feature_hashes.count(), 1)
+
+        with mock.patch(
+            "django_geosource.geostore_callbacks.feature_callback"
+        ) as mocked:
+            result = self.geojson_source.refresh_data()
+
+        mocked.assert_not_called()
+        self.assertEqual(
+            result,
+            {
+                "count": 1,
+                "total": 1,
+                "inserted": 0,
+                "updated": 0,
+                "unchanged": 1,
+                "deleted": 0,
+            },
+        )
+        self.assertEqual(self.geojson_source.report["features"]["unchanged"], 1)
+        # The unchanged feature is kept by the cleanup
+        self.assertEqual(Feature.objects.get().properties, {"id": 1, "test": 5})
+
+    @mock.patch("django_geosource.models.DIFFERENTIAL_REFRESH", True)
+    def test_differential_refresh_changed_feature(self):
+        self.geojson_source.refresh_data()
+        self.geojson_source.feature_hashes.update(hash="outdated")
+
+        result = self.geojson_source.refresh_data()
+
+        self.assertEqual((result["updated"], result["unchanged"]), (1, 0))
+        self.assertNotEqual(self.geojson_source.feature_hashes.get().hash, "outdated")
+
+    @mock.patch("django_geosource.models.DIFFERENTIAL_REFRESH", True)
+    def test_differential_refresh_missing_feature(self):
+        self.geojson_source.refresh_data()
+        # Features purged from the layer, or a new layer after a rename
+        self.geojson_source.get_layer().features.all().delete()
+
+        result = self.geojson_source.refresh_data()
+
+        self.assertEqual((result["inserted"], result["unchanged"]), (1, 0))
+        self.assertEqual(self.geojson_source.get_layer().features.count(), 1)
+
+    def get_point_records(self, count, error=False):
+        for i in range(count):
+            yield {"_geom_": f"SRID=4326;POINT ({i} {i})", "id": i}
+        if error:
+            raise Exception("Worker lost")
+
+    @mock.patch("django_geosource.models.REFRESH_CHUNK_SIZE", 2)
+    def test_refresh_data_by_chunks(self):
+        with mock.patch.object(
+            GeoJSONSource, "_get_records", return_value=self.get_point_records(3)
+        ):
+            result = self.geojson_source.refresh_data()
+
+        self.assertEqual(result, {"count": 3, "total": 3})
+        self.assertEqual(Feature.objects.count(), 3)
+        self.assertEqual(self.geojson_source.refresh_checkpoint, {})
+
+    @mock.patch("django_geosource.models.REFRESH_CHUNK_SIZE", 1)
+    @mock.patch("django_geosource.models.REFRESH_CHECKPOINT_INTERVAL", 0)
+    def test_refresh_data_resume_from_checkpoint(self):
+        with mock.patch.object(
+            GeoJSONSource,
+            "_get_records",
+            return_value=self.get_point_records(2, error=True),
+        ):
+            with self.assertRaisesRegexp(Exception, "Worker lost"):
+                self.geojson_source.refresh_data()
+
+        self.geojson_source.refresh_from_db()
+        self.assertEqual(self.geojson_source.refresh_checkpoint["offset"], 2)
+        self.assertEqual(Feature.objects.count(), 2)
+
+        with mock.patch.object(
+            GeoJSONSource, "_get_records", return_value=self.get_point_records(3)
+        ), mock.patch(
+            "django_geosource.geostore_callbacks.feature_callback",
+            wraps=geostore_callbacks.feature_callback,
+        ) as mocked:
+            result = self.geojson_source.refresh_data()
+
+        # Only the record after the checkpoint is written again
+        mocked.assert_called_once()
+        self.assertEqual(result, {"count": 3, "total": 3})
+        self.assertEqual(Feature.objects.count(), 3)
+        self.assertEqual(self.geojson_source.refresh_checkpoint, {})
+
+    @mock.patch("django_geosource.models.REFRESH_CHUNK_SIZE", 1)
+    def test_refresh_data_checkpoint_interval(self):
+        with mock.patch.object(
+            GeoJSONSource,
+            "_get_records",
+            return_value=self.get_point_records(2, error=True),
+        ):
+            with self.assertRaisesRegexp(Exception, "Worker lost"):
+                self.geojson_source.refresh_data()
+
+        # Chunks are committed, but no checkpoint is saved within the interval
+        self.geojson_source.refresh_from_db()
+        self.assertEqual(self.geojson_source.refresh_checkpoint, {})
+        self.assertEqual(Feature.objects.count(), 2)
+
+    def test_get_feature_hash(self):
+        geometry = "POINT (1 1)"
+        value = self.source.get_feature_hash(geometry, {"a": 1, "b": 2})
+        self.assertEqual(
+            value, self.source.get_feature_hash(geometry, {"b": 2, "a": 1})
+        )
+        self.assertNotEqual(value, self.source.get_feature_hash(geometry, {"a": 2}))
+        self.assertIsNone(self.source.get_feature_hash("not a geometry", {}))
+
     def test_delete(self):
         self.geojson_source.refresh_data()
         self.assertEqual(Layer.objects.count(), 1)
@@ -119,7 +339,7 @@ class ModelSourceTestCase(TestCase):
         self.geojson_source.save()
         self.geojson_source.get_status()
         self.assertEqual(
-            {"state": "ENDED", "result": "OK!", "done": "DONE"},
+            {"state": "ENDED", "result": "OK!", "done": "DONE", "locked": False},
             self.geojson_source.get_status(),
         )
 
@@ -128,9 +348,91 @@ class ModelSourceTestCase(TestCase):
         self.geojson_source.task_id = 1
         self.geojson_source.save()
         self.assertEqual(
-            {"state": "ENDED", "done": "DONE", "1": "NOT OK!"},
+            {"state": "ENDED", "done": "DONE", "1": "NOT OK!", "locked": False},
+            self.geojson_source.get_status(),
+        )
+
+    @mock.patch("django_geosource.models.AsyncResult")
+    def test_get_status_stored(self, mocked):
+        self.geojson_source.task_id = "task"
+        self.geojson_source.task_state = "SUCCESS"
+        self.geojson_source.task_done = "DONE"
+        self.geojson_source.task_result = {"count": 1}
+        self.assertEqual(
+            {
+                "state": "SUCCESS",
+                "result": {"count": 1},
+                "done": "DONE",
+                "locked": False,
+            },
+            self.geojson_source.get_status(),
+        )
+
+        self.geojson_source.task_state = "FAILURE"
+        self.geojson_source.task_result = {"method": "refresh_data"}
+        self.assertEqual(
+            {
+                "state": "FAILURE",
+                "done": "DONE",
+                "method": "refresh_data",
+                "locked": False,
+            },
             self.geojson_source.get_status(),
         )
+        mocked.assert_not_called()
+
+    def test_refresh_lock(self):
+        other = connections.create_connection("default")
+        try:
+            with other.cursor() as cursor:
+                cursor.execute(
+                    "SELECT pg_advisory_lock(%s, %s)",
+                    [Source.REFRESH_LOCK_NAMESPACE, self.geojson_source.pk],
+                )
+            self.geojson_source.task_id = "task"
+            self.geojson_source.task_state = "STARTED"
+            self.geojson_source.task_result = {"action": "refresh_data"}
+
+            self.assertTrue(self.geojson_source.get_status(progress=False)["locked"])
+            self.assertFalse(self.geojson_source.can_sync)
+            with self.assertRaises(MethodNotAllowed):
+                self.geojson_source.refresh_data()
+        finally:
+            other.close()
+
+        # The lock is released with the session of a dead worker
+        self.assertFalse(self.geojson_source.get_status(progress=False)["locked"])
+        self.assertTrue(self.geojson_source.can_sync)
+        self.geojson_source.refresh_data()
+        self.assertFalse(self.geojson_source.is_refresh_locked())
+
+    def test_forced_refresh_locked(self):
+        other = connections.create_connection("default")
+        try:
+            with other.cursor() as cursor:
+                cursor.execute(
+                    "SELECT pg_advisory_lock(%s, %s)",
+                    [Source.REFRESH_LOCK_NAMESPACE, self.geojson_source.pk],
+                )
+            self.geojson_source.task_id = "task"
+
+            with self.assertRaises(MethodNotAllowed):
+                self.geojson_source.run_async_method("refresh_data", force=True)
+        finally:
+            other.close()
+
+        # The running task is still the one of the source
+        self.assertEqual(self.geojson_source.task_id, "task")
+
+    def test_lock_not_queried_for_done_task(self):
+        self.geojson_source.task_id = "task"
+        self.geojson_source.task_state = "SUCCESS"
+
+        with CaptureQueriesContext(connection) as queries:
+            status = self.geojson_source.get_status(progress=False)
+
+        self.assertFalse(status["locked"])
+        self.assertEqual(len(queries), 0)
 
 
 class ModelFieldTestCase(TestCase):
@@ -146,17 +448,89 @@ class ModelPostGISSourceTestCase(TestCase):
         self.source = PostGISSource.objects.create(
             name="Toto", geom_type=GeometryTypes.Point.value, geom_field=self.geom_field
         )
+        self.addCleanup(pool.clear)
 
     def test_source_geom_attribute(self):
         self.assertEqual(self.geom_field, self.source.SOURCE_GEOM_ATTRIBUTE)
 
-    @mock.patch("psycopg2.connect", return_value=mock.Mock())
+    @mock.patch("psycopg2.connect", return_value=mock.MagicMock())
     def test_test_get_records(self, mock_con):
-        self.source._get_records(1)
+        list(self.source._get_records(1))
+        mock_con.assert_called_once()
+
+    @mock.patch("django_geosource.models.REFRESH_CHUNK_SIZE", 10)
+    def test_refresh_data_not_resumed(self):
+        self.source.refresh_checkpoint = {
+            "begin_date": timezone.now().isoformat(),
+            "offset": 2,
+            "count": 2,
+        }
+        records = [{self.geom_field: GEOSGeometry("POINT (0 0)", srid=4326), "id": 1}]
+        with mock.patch.object(
+            PostGISSource, "_get_records", return_value=iter(records)
+        ):
+            result = self.source.refresh_data()
+
+        # Records are not skipped, as they can be read in another order
+        self.assertEqual(result, {"count": 1, "total": 1})
+        self.assertEqual(self.source.refresh_checkpoint, {})
+
+    @mock.patch("psycopg2.connect")
+    def test_get_records_use_named_cursor(self, mock_con):
+        mock_con.return_value.closed = 0
+        mock_con.return_value.info.transaction_status = TRANSACTION_STATUS_IDLE
+        cursor = mock_con.return_value.cursor.return_value.__enter__.return_value
+        cursor.__iter__.return_value = iter([{"id": 1}, {"id": 2}])
+
+        records = self.source._get_records()
+        self.assertEqual(next(records), {"id": 1})
+        self.assertEqual(cursor.itersize, 2000)
+        self.assertEqual(
+            mock_con.return_value.cursor.call_args[0], ("geosource_records",)
+        )
+        mock_con.return_value.rollback.assert_not_called()
+
+        # Connection is released as soon as the records are not used anymore
+        records.close()
+        mock_con.return_value.rollback.assert_called_once()
+        mock_con.return_value.close.assert_not_called()
+
+        # Then reused by the next read
+        list(self.source._get_records(1))
         mock_con.assert_called_once()
 
 
 class ModelGeoJSONSourceTestCase(TestCase):
+    def test_get_preview(self):
+        source = GeoJSONSource.objects.create(
+            name="Titi",
+            geom_type=GeometryTypes.Point.value,
+            file=os.path.join(os.path.dirname(__file__), "data", "test.geojson"),
+        )
+        records = [
+            {
+                "_geom_": GEOSGeometry(f"SRID=3857;POINT ({x} 0)"),
+                "id": i,
+                "value": value,
+            }
+            for i, (x, value) in enumerate([(111319.49, 1), (0, 2.5)])
+        ]
+        with mock.patch.object(GeoJSONSource, "_get_records", return_value=records):
+            preview = source.get_preview()
+
+        # Typed as by update_fields, from all the records
+        self.assertEqual(
+            preview["fields"],
+            [
+                {"name": "id", "data_type": FieldTypes.Integer.value},
+                {"name": "value", "data_type": FieldTypes.Float.value},
+            ],
+        )
+        # Same projection as the features of the layer
+        self.assertAlmostEqual(
+            preview["records"][0]["geometry"]["coordinates"][0], 1, places=5
+        )
+
     def test_get_file_as_dict(self):
         source = GeoJSONSource.objects.create(
             name="Titi",
@@ -196,12 +570,38 @@ class ModelGeoJSONSourceTestCase(TestCase):
             file=os.path.join(os.path.dirname(__file__), "data", "bad_geom.geojson"),
         )
         with self.assertRaises(ValueError) as m:
-            source._get_records(1)
+            list(source._get_records(1))
         self.assertEqual(
             "The record geometry seems invalid.",
             str(m.exception),
         )
 
+    def test_get_records_wrong_file(self):
+        source = GeoJSONSource.objects.create(
+            name="Titi",
+            geom_type=GeometryTypes.Point.value,
+            file=os.path.join(os.path.dirname(__file__), "data", "bad.geojson"),
+        )
+        with self.assertRaises(json.decoder.JSONDecodeError):
+            list(source._get_records())
+        self.assertIn("Source's GeoJSON file is not valid", source.report["message"])
+
+    def test_get_records_is_lazy(self):
+        source = GeoJSONSource.objects.create(
+            name="Titi",
+            geom_type=GeometryTypes.Point.value,
+            file=os.path.join(os.path.dirname(__file__), "data", "test.geojson"),
+        )
+        records = source._get_records(1)
+        self.assertNotIsInstance(records, list)
+        records = list(records)
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["id"], 1)
+        self.assertEqual(records[0]["_geom_"].geom_type, "Point")
+        # the file can be read many times from the same instance
+        self.assertEqual(len(list(source._get_records())), 1)
+        self.assertTrue(source.file.closed)
+
 
 class ModelShapeFileSourceTestCase(TestCase):
     def test_get_records(self):
@@ -210,7 +610,8 @@ class ModelShapeFileSourceTestCase(TestCase):
             geom_type=GeometryTypes.Point.value,
             file=os.path.join(os.path.dirname(__file__), "data", "test.zip"),
         )
-        records = source._get_records(1)
+        records = list(source._get_records(1))
+        self.assertEqual(len(records), 1)
         self.assertEqual(records[0]["NOM"], "Trifouilli-les-Oies")
         self.assertEqual(records[0]["Insee"], 99999)
         self.assertEqual(records[0]["_geom_"].geom_typeid, GeometryTypes.Polygon.value)
@@ -228,6 +629,36 @@ class ModelCommandSourceTestCase(TestCase):
         self.source.refresh_data()
         self.assertIn("TestFooBarBar", mocked_stdout.getvalue())
 
+    def test_refresh_data_last_refresh(self):
+        last_refresh = self.source.last_refresh
+        with mock.patch("django_geosource.models.call_command"):
+            self.source.refresh_data()
+
+        # Property values are cached until the next refresh
+        self.source.refresh_from_db()
+        self.assertGreater(self.source.last_refresh, last_refresh)
+
+    def test_refresh_data_locked(self):
+        def command(*args):
+            self.assertTrue(self.source.is_refresh_locked())
+
+        with mock.patch("django_geosource.models.call_command", side_effect=command):
+            self.source.refresh_data()
+
+        self.assertFalse(self.source.is_refresh_locked())
+
+    def test_refresh_data_database_error(self):
+        def command(*args):
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT * FROM geosource_missing_table")
+
+        # The error is not hidden by the lock release
+        with mock.patch("django_geosource.models.call_command", side_effect=command):
+            with self.assertRaises(ProgrammingError):
+                self.source.refresh_data()
+
+        self.assertFalse(self.source.is_refresh_locked())
+
     def test_get_records(self):
         self.assertEqual([], self.source._get_records())
 
@@ -278,7 +709,7 @@ class ModelCSVSourceTestCase(TestCase):
                 "latitude_field": "YCOORD",
             },
         )
-        records = source._get_records()
+        records = list(source._get_records())
         self.assertEqual(len(records), 6, len(records))
 
         row_count = source.refresh_data()
@@ -300,7 +731,7 @@ class ModelCSVSourceTestCase(TestCase):
                 "coordinates_field_count": "xy",
             },
         )
-        records = source._get_records()
+        records = list(source._get_records())
         self.assertEqual(len(records), 9, len(records))
         row_count = source.refresh_data()
         self.assertEqual(row_count["count"], len(records), row_count)
@@ -326,7 +757,7 @@ class ModelCSVSourceTestCase(TestCase):
                 "coordinates_field_count": "xy",
             },
         )
-        records = source._get_records()
+        records = list(source._get_records())
         self.assertEqual(len(records), 9, len(records))
         row_count = source.refresh_data()
         self.assertEqual(row_count["count"], len(records), row_count)
@@ -350,7 +781,7 @@ class ModelCSVSourceTestCase(TestCase):
                 "latitude_field": "YCOORD",
             },
         )
-        records = source._get_records()
+        records = list(source._get_records())
         # this entry as an empty column and should not be in records
         empty_entry = [
             record.get("photoEtablissement")
@@ -361,6 +792,106 @@ class ModelCSVSourceTestCase(TestCase):
         row_count = source.refresh_data()
         self.assertEqual(row_count["count"], len(records), row_count)
 
+    def test_null_columns_cached_for_limited_reads(self):
+        source = CSVSource.objects.create(
+            file=os.path.join(
+                settings.BASE_DIR, "django_geosource", "tests", "source.csv"
+            ),
+            geom_type=0,
+            id_field="ID",
+            settings={
+                **self.base_settings,
+                "ignore_columns": True,
+                "coordinates_field": "two_columns",
+                "longitude_field": "XCOORD",
+                "latitude_field": "YCOORD",
+            },
+        )
+        with mock.patch.object(
+            CSVSource,
+            "_find_null_columns_indexes",
+            autospec=True,
+            side_effect=CSVSource._find_null_columns_indexes,
+        ) as mocked:
+            full = list(source._get_records())
+            limited = list(source._get_records(2))
+
+        # The empty columns found by the full read are reused by the limited one
+        mocked.assert_called_once()
+        self.assertEqual(limited, full[:2])
+
+        # Until they expire
+        with mock.patch.object(
+            CSVSource,
+            "_find_null_columns_indexes",
+            autospec=True,
+            side_effect=CSVSource._find_null_columns_indexes,
+        ) as mocked, mock.patch(
+            "django_geosource.models.NULL_COLUMNS_CACHE_TIMEOUT", 0
+        ):
+            list(source._get_records())
+            list(source._get_records(2))
+        self.assertEqual(mocked.call_count, 2)
+
+    def test_invalid_points_report_saved_once(self):
+        source = CSVSource.objects.create(
+            file=os.path.join(
+                settings.BASE_DIR, "django_geosource", "tests", "source.csv"
+            ),
+            geom_type=0,
+            id_field="ID",
+            settings={
+                **self.base_settings,
+                "coordinates_field": "two_columns",
+                "longitude_field": "XCOORD",
+                # Not a coordinate on purpose, so every point is invalid
+                "latitude_field": "LibelleCommuneEtablissement",
+            },
+        )
+        with mock.patch(
+            "django_geosource.reports.REPORT_SAMPLE_SIZE", 2
+        ), CaptureQueriesContext(connection) as queries:
+            records = list(source._get_records())
+
+        self.assertEqual(records, [])
+        updates = [query for query in queries if query["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+        source.refresh_from_db()
+        self.assertEqual(source.report["status"], "Warning")
+        self.assertEqual(source.report["occurrences"], {"invalid_geometry": 6})
+        self.assertEqual(len(source.report["message"]), 2)
+
+    def test_refresh_data_writes_issues(self):
+        source = CSVSource.objects.create(
+            file=os.path.join(
+                settings.BASE_DIR, "django_geosource", "tests", "source.csv"
+            ),
+            geom_type=0,
+            id_field="ID",
+            settings={
+                **self.base_settings,
+                "coordinates_field": "two_columns",
+                "longitude_field": "XCOORD",
+                # Not a coordinate on purpose, so every point is invalid
+                "latitude_field": "LibelleCommuneEtablissement",
+            },
+        )
+        previous = RefreshIssue.objects.create(
+            source=source, run=timezone.now(), severity=0, kind="test", message="test"
+        )
+
+        with self.assertRaisesMessage(Exception, "Failed to refresh data"):
+            source.refresh_data()
+
+        issues = source.issues.order_by("line")
+        self.assertEqual(
+            [(issue.kind, issue.line) for issue in issues],
+            [("invalid_geometry", line) for line in range(6)],
+        )
+        self.assertNotIn(previous, issues)
+        # Lines are in the issues, not in the report
+        self.assertNotIn("lines", source.report)
+
     def test_get_records_with_no_header_and_yx_csv(self):
         source_name = os.path.join(
             settings.BASE_DIR,
@@ -381,7 +912,7 @@ class ModelCSVSourceTestCase(TestCase):
                 "coordinates_field_count": "yx",
             },
         )
-        records = source._get_records()
+        records = list(source._get_records())
         self.assertEqual(len(records), 9, len(records))
 
         row_count = source.refresh_data()
@@ -407,11 +938,68 @@ class ModelCSVSourceTestCase(TestCase):
                 "longitude_field": "0",
             },
         )
-        records = source._get_records()
+        records = list(source._get_records())
         self.assertEqual(len(records), 10, len(records))
         row_count = source.refresh_data()
         self.assertEqual(row_count["count"], len(records), row_count)
 
+    def test_get_records_with_short_rows(self):
+        source = CSVSource.objects.create(
+            file=SimpleUploadedFile("short.csv", b"1;2;a\n\n3\n4;5;b\n"),
+            geom_type=0,
+            id_field="2",
+            settings={
+                **self.base_settings,
+                "use_header": False,
+                "coordinates_field": "two_columns",
+                "latitude_field": "1",
+                "longitude_field": "0",
+            },
+        )
+        # Rows missing coordinates are reported, not failing the whole read
+        records = list(source._get_records())
+        self.assertEqual([record["2"] for record in records], ["a", "b"])
+
+    def test_get_records_read_together(self):
+        source = CSVSource.objects.create(
+            file=SimpleUploadedFile("together.csv", b"1;2;a\n3;4;b\n"),
+            geom_type=0,
+            id_field="2",
+            settings={
+                **self.base_settings,
+                "use_header": False,
+                "coordinates_field": "two_columns",
+                "latitude_field": "1",
+                "longitude_field": "0",
+            },
+        )
+        first, second = source._get_records(), source._get_records()
+        next(first), next(second)
+        # Ending a read closes its own file only
+        self.assertEqual(len(list(first)), 1)
+        self.assertEqual([record["2"] for record in second], ["b"])
+
+    def test_get_records_with_limit_and_ignored_lines(self):
+        source_name = os.path.join(
+            settings.BASE_DIR, "django_geosource", "tests", "source_noheader.csv"
+        )
+        source = CSVSource.objects.create(
+            file=source_name,
+            geom_type=0,
+            id_field="2",
+            settings={
+                **self.base_settings,
+                "use_header": False,
+                "number_lines_to_ignore": 3,
+                "coordinate_reference_system": "EPSG_2154",
+                "coordinates_field": "two_columns",
+                "latitude_field": "1",
+                "longitude_field": "0",
+            },
+        )
+        records = list(source._get_records(2))
+        self.assertEqual([record["2"] for record in records], [4, 5])
+
     def test_update_fields_keep_order(self):
         source_name = os.path.join(
             settings.BASE_DIR, "django_geosource", "tests", "source.csv"
@@ -434,3 +1022,32 @@ class ModelCSVSourceTestCase(TestCase):
         source.update_fields()
         fields = [f.name for f in Field.objects.filter(source=source)]
         self.assertTrue(fields == colnames)
+
+    def test_update_fields_queries(self):
+        source = GeoJSONSource.objects.create(
+            name="test",
+            geom_type=GeometryTypes.Point.value,
+            file=os.path.join(os.path.dirname(__file__), "data", "test.geojson"),
+        )
+        Field.objects.create(source=source, name="field_0", label="Label")
+        Field.objects.create(source=source, name="removed")
+
+        def get_records(columns):
+            return [
+                {"_geom_": "POINT (0 0)", **{f"field_{i}": i for i in range(columns)}}
+                for record in range(3)
+            ]
+
+        queries = []
+        for columns in (3, 30):
+            with mock.patch.object(
+                GeoJSONSource, "_get_records", return_value=get_records(columns)
+            ), CaptureQueriesContext(connection) as context:
+                self.assertEqual(source.update_fields(), {"count": columns})
+            queries.append(len(context.captured_queries))
+
+        self.assertEqual(queries[0], queries[1])
+        self.assertEqual(source.fields.count(), 30)
+        self.assertEqual(source.fields.get(name="field_0").label, "Label")
+        self.assertEqual(source.fields.get(name="field_29").sample, [29, 29, 29])
+        self.assertEqual(source.fields.get(name="field_29").order, 29)
@@ -4,7 +4,7 @@ from unittest import mock
 from django.test import TestCase
 from django.utils import timezone
 from django_geosource.models import GeometryTypes, PostGISSource, GeoJSONSource
-from django_geosource.periodics import auto_refresh_source
+from django_geosource.periodics import auto_refresh_source, claim_due_sources
 import os
 
 
@@ -97,3 +97,105 @@ class PeriodicsTestCase(TestCase):
             auto_refresh_source()
 
             mocked2.assert_not_called()
+
+    def test_next_refresh_at(self):
+        self.assertIsNone(self.source.next_refresh_at)
+        self.assertIsNone(self.geosource.next_refresh_at)
+        self.assertEqual(
+            self.source2.next_refresh_at, datetime(2020, 1, 4, tzinfo=timezone.utc)
+        )
+
+    @mock.patch("django.utils.timezone.now")
+    def test_claim_due_sources(self, mock_timezone):
+        mock_timezone.return_value = datetime(2020, 1, 10, tzinfo=timezone.utc)
+
+        self.assertEqual(claim_due_sources(), [self.source2])
+        # Claimed sources are postponed, so they are not claimed twice
+        self.assertEqual(claim_due_sources(), [])
+        self.source2.refresh_from_db()
+        self.assertGreater(self.source2.next_refresh_at, mock_timezone.return_value)
+
+    @mock.patch("django.utils.timezone.now")
+    def test_claim_due_sources_skip_running(self, mock_timezone):
+        mock_timezone.return_value = datetime(2020, 1, 10, tzinfo=timezone.utc)
+        PostGISSource.objects.filter(pk=self.source2.pk).update(
+            task_state="STARTED", task_date=mock_timezone.return_value
+        )
+
+        self.assertEqual(claim_due_sources(), [])
+
+    @mock.patch("django.utils.timezone.now")
+    @mock.patch("django_geosource.periodics.REFRESH_CONCURRENCY", 1)
+    def test_claim_cheapest_sources_first(self, mock_timezone):
+        mock_timezone.return_value = datetime(2020, 1, 10, tzinfo=timezone.utc)
+        PostGISSource.objects.filter(pk=self.source2.pk).update(
+            report={"duration": 300}
+        )
+        cheap = PostGISSource.objects.create(
+            name="Cheap Source",
+            db_host="localhost",
+            db_name="dbname",
+            db_username="username",
+            query="SELECT 1",
+            geom_field="geom",
+            refresh=60,
+            last_refresh=datetime(2020, 1, 1, tzinfo=timezone.utc),
+            geom_type=GeometryTypes.LineString.value,
+            report={"duration": 2},
+        )
+
+        self.assertEqual(claim_due_sources(), [cheap])
+        PostGISSource.objects.filter(pk=cheap.pk).update(
+            task_state="STARTED", task_date=mock_timezone.return_value
+        )
+        # The only refresh slot is taken
+        self.assertEqual(claim_due_sources(), [])
+
+    @mock.patch("django.utils.timezone.now")
+    @mock.patch(
+        "django_geosource.periodics.REFRESH_CONCURRENCY_PER_TYPE", {"PostGISSource": 1}
+    )
+    def test_claim_due_sources_per_type_limit(self, mock_timezone):
+        mock_timezone.return_value = datetime(2020, 1, 10, tzinfo=timezone.utc)
+        PostGISSource.objects.filter(pk=self.source.pk).update(
+            task_state="STARTED", task_date=mock_timezone.return_value
+        )
+
+        self.assertEqual(claim_due_sources(), [])
+
+    @mock.patch("django.utils.timezone.now")
+    def test_claim_due_sources_killed_refresh(self, mock_timezone):
+        mock_timezone.return_value = datetime(2020, 1, 10, tzinfo=timezone.utc)
+        PostGISSource.objects.filter(pk=self.source2.pk).update(
+            task_state="STARTED",
+            task_date=mock_timezone.return_value,
+            task_result={"action": "refresh_data"},
+        )
+
+        with self.source2.refresh_lock():
+            self.assertEqual(claim_due_sources(), [])
+        # The lock was released without the task ending
+        self.assertEqual(claim_due_sources(), [self.source2])
+
+    @mock.patch("django.utils.timezone.now")
+    @mock.patch("django_geosource.periodics.REFRESH_CONCURRENCY", 1)
+    def test_claim_overdue_costly_sources(self, mock_timezone):
+        mock_timezone.return_value = datetime(2020, 1, 10, tzinfo=timezone.utc)
+        # Overdue for 6 days
+        PostGISSource.objects.filter(pk=self.source2.pk).update(
+            report={"duration": 3600}
+        )
+        PostGISSource.objects.create(
+            name="Cheap Source",
+            db_host="localhost",
+            db_name="dbname",
+            db_username="username",
+            query="SELECT 1",
+            geom_field="geom",
+            refresh=60,
+            last_refresh=datetime(2020, 1, 9, 23, tzinfo=timezone.utc),
+            geom_type=GeometryTypes.LineString.value,
+            report={"duration": 2},
+        )
+
+        self.assertEqual(claim_due_sources(), [self.source2])
@@ -0,0 +1,104 @@
+import threading
+from unittest import mock
+
+import psycopg2
+from django.test import SimpleTestCase
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.pool import PoolError
+
+from django_geosource.pool import ConnectionPool
+
+PARAMS = {
+    "host": "localhost",
+    "port": 5432,
+    "dbname": "test",
+    "user": "test",
+    "password": "test",
+}
+
+
+def get_connection(*args, **kwargs):
+    conn = mock.MagicMock(closed=0)
+    conn.info.transaction_status = TRANSACTION_STATUS_IDLE
+    return conn
+
+
+@mock.patch("psycopg2.connect", side_effect=get_connection)
+class ConnectionPoolTestCase(SimpleTestCase):
+    def test_connection_reused(self, mocked_connect):
+        pool = ConnectionPool(max_size=2)
+        with pool.connection(**PARAMS) as conn:
+            pass
+        with pool.connection(**PARAMS) as other:
+            self.assertIs(other, conn)
+        mocked_connect.assert_called_once()
+
+        # Another password opens another connection
+        with pool.connection(**{**PARAMS, "password": "other"}) as other:
+            self.assertIsNot(other, conn)
+        self.assertEqual(mocked_connect.call_count, 2)
+
+    def test_max_size(self, mocked_connect):
+        pool = ConnectionPool(max_size=2, timeout=0)
+        first = pool.getconn(**PARAMS)
+        pool.getconn(**PARAMS)
+        with self.assertRaises(PoolError):
+            pool.getconn(**PARAMS)
+
+        pool.putconn(first)
+        self.assertIs(pool.getconn(**PARAMS), first)
+
+    def test_broken_connection_discarded(self, mocked_connect):
+        pool = ConnectionPool(max_size=1)
+        with pool.connection(**PARAMS) as conn:
+            pass
+        conn.cursor.return_value.__enter__.return_value.execute.side_effect = (
+            psycopg2.OperationalError("server closed the connection")
+        )
+
+        with pool.connection(**PARAMS) as other:
+            self.assertIsNot(other, conn)
+            # A connection released in a transaction is not reused
+            other.info.transaction_status = None
+        conn.close.assert_called_once()
+
+        with pool.connection(**PARAMS) as last:
+            self.assertIsNot(last, other)
+
+    def test_health_check_unlocked(self, mocked_connect):
+        pool = ConnectionPool(max_size=2)
+        with pool.connection(**PARAMS) as conn:
+            pass
+        acquired = []
+
+        def acquire():
+            if pool._condition.acquire(timeout=1):
+                acquired.append(True)
+                pool._condition.release()
+
+        def execute(query):
+            # Other threads can use the pool while the server is queried
+            thread = threading.Thread(target=acquire)
+            thread.start()
+            thread.join()
+
+        conn.cursor.return_value.__enter__.return_value.execute.side_effect = execute
+        self.assertIs(pool.getconn(**PARAMS), conn)
+        self.assertEqual(acquired, [True])
+
+    def test_idle_timeout(self, mocked_connect):
+        pool = ConnectionPool(idle_timeout=0)
+        with pool.connection(**PARAMS) as conn:
+            pass
+        with pool.connection(**PARAMS) as other:
+            self.assertIsNot(other, conn)
+        conn.close.assert_called_once()
+
+    def test_clear(self, mocked_connect):
+        pool = ConnectionPool(max_size=1, timeout=0)
+        with pool.connection(**PARAMS) as conn:
+            pass
+        pool.clear()
+        conn.close.assert_called_once()
+        pool.getconn(**PARAMS)
+        self.assertEqual(mocked_connect.call_count, 2)
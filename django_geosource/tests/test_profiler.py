@@ -0,0 +1,106 @@
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django_geosource.profiler import DISTINCT_SKETCH_SIZE, FieldProfiler
+
+
+class FieldProfilerTestCase(SimpleTestCase):
+    def test_statistics(self):
+        profiler = FieldProfiler(sample_size=2)
+        for i in range(10):
+            profiler.add(
+                {
+                    "id": i,
+                    "value": i * 0.5 if i % 2 else i,
+                    "date": "2022-03-0%d" % (i % 3 + 1),
+                    "sparse": "a" if i == 5 else None,
+                }
+            )
+
+        statistics = profiler.statistics()
+        self.assertEqual(list(statistics), ["id", "value", "date", "sparse"])
+        self.assertEqual(statistics["id"]["data_type"], "Integer")
+        self.assertEqual((statistics["id"]["min"], statistics["id"]["max"]), (0, 9))
+        self.assertEqual(statistics["id"]["distinct"], 10)
+        self.assertEqual(statistics["value"]["data_type"], "Float")
+        self.assertEqual(statistics["date"]["data_type"], "Date")
+        self.assertEqual(statistics["date"]["max"], "2022-03-03")
+        self.assertEqual(
+            statistics["date"]["top"][0], {"value": "2022-03-01", "count": 4}
+        )
+        # A sparse field is typed from its values, not from the first record
+        self.assertEqual(statistics["sparse"]["data_type"], "String")
+        self.assertEqual(statistics["sparse"]["null_ratio"], 0.9)
+        self.assertEqual(profiler.fields["id"].sample, [0, 1])
+
+    def test_bytes_and_dates(self):
+        profiler = FieldProfiler()
+        profiler.add({"a": b"4", "b": b"\xe8", "c": date(2022, 1, 1)})
+
+        profiles = profiler.fields
+        self.assertEqual(profiles["a"].data_type, "Undefined")
+        self.assertEqual(profiles["b"].undecodable, 1)
+        self.assertEqual(profiles["c"].data_type, "Date")
+
+    def test_bounded_distinct_estimate(self):
+        profiler = FieldProfiler()
+        for i in range(20000):
+            profiler.add({"id": i})
+
+        profile = profiler.fields["id"]
+        self.assertEqual(len(profile.hashes), DISTINCT_SKETCH_SIZE)
+        self.assertAlmostEqual(profile.distinct / 20000, 1, delta=0.25)
+        self.assertLessEqual(len(profile.frequent), 20)
+
+    def test_merge_states(self):
+        first, second, full = FieldProfiler(), FieldProfiler(), FieldProfiler()
+        for i in range(100):
+            (first if i < 50 else second).add({"id": i, "kind": i % 3})
+            full.add({"id": i, "kind": i % 3})
+
+        merged = FieldProfiler(first.as_state())
+        merged.merge(second.as_state())
+
+        statistics = merged.statistics()
+        expected = full.statistics()
+        # Frequent values of fields with many distinct values are approximate
+        statistics["id"].pop("top")
+        expected["id"].pop("top")
+        self.assertEqual(statistics, expected)
+
+    @mock.patch("django_geosource.profiler.FIELD_VALUES_LIMIT", 4)
+    def test_distinct_values(self):
+        profiler = FieldProfiler()
+        for value in (1, 1.0, True, None, 1):
+            profiler.add({"few": value, "many": value, "id": id(value)})
+        for value in range(5):
+            profiler.add({"many": value})
+
+        values = profiler.fields["few"].values
+        self.assertEqual(
+            values,
+            {
+                ("int", 1): 2,
+                ("float", 1.0): 1,
+                ("bool", True): 1,
+                ("NoneType", None): 1,
+            },
+        )
+        self.assertIsNone(profiler.fields["many"].values)
+        state = FieldProfiler(profiler.as_state()).as_state()
+        self.assertEqual(state, profiler.as_state())
+
+    def test_values_encoded(self):
+        profiler = FieldProfiler()
+        moment = datetime(2020, 1, 1, 10, tzinfo=timezone.utc)
+        profiler.add({"date": moment, "decimal": Decimal("1.5")})
+
+        # Same as in the properties of the features
+        self.assertEqual(
+            profiler.fields["date"].values, {("str", "2020-01-01T10:00:00Z"): 1}
+        )
+        self.assertEqual(profiler.fields["decimal"].values, {("str", "1.5"): 1})
+        state = FieldProfiler(profiler.as_state()).as_state()
+        self.assertEqual(state, profiler.as_state())
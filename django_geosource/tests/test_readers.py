@@ -0,0 +1,164 @@
+import json
+import os
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.contrib.gis.gdal.error import GDALException
+from django.contrib.gis.geos import GEOSGeometry
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase
+from django_geosource import readers
+from django_geosource.models import ShapefileSource
+from django_geosource.readers import (
+    JSONStream,
+    geometry_from_mapping,
+    iter_geojson_features,
+    local_file_path,
+    to_wgs84,
+)
+
+
+class IterGeoJSONFeaturesTestCase(SimpleTestCase):
+    def setUp(self):
+        self.features = [
+            {
+                "type": "Feature",
+                "properties": {"id": i, "name": f"feature ☃ {i}", "value": 12345.678},
+                "geometry": {"type": "Point", "coordinates": [i, 45.123456789]},
+            }
+            for i in range(20)
+        ]
+        self.geojson = json.dumps(
+            {
+                "type": "FeatureCollection",
+                "crs": {"type": "name", "properties": {"name": "EPSG:4326"}},
+                "features": self.features,
+                "bbox": [0, 0, 1, 1],
+            },
+            indent=2,
+            ensure_ascii=False,
+        )
+
+    def test_features_are_read_across_chunks(self):
+        for chunk_size in (1, 7, 64, 100000):
+            features = list(
+                iter_geojson_features(
+                    BytesIO(self.geojson.encode()), chunk_size=chunk_size
+                )
+            )
+            self.assertEqual(features, self.features, chunk_size)
+
+    def test_numbers_read_across_chunks(self):
+        content = '{"version": 12.75, "features": [], "scale": 1e-5}'
+        for chunk_size in range(1, len(content) + 1):
+            stream = JSONStream(StringIO(content), chunk_size=chunk_size)
+            stream.expect("{")
+            values = []
+            while True:
+                values.append(stream.decode())
+                stream.expect(":")
+                values.append(stream.decode())
+                if stream.expect(",", "}") == "}":
+                    break
+            self.assertEqual(
+                values, ["version", 12.75, "features", [], "scale", 1e-5], chunk_size
+            )
+
+    def test_text_file(self):
+        features = list(iter_geojson_features(StringIO(self.geojson), chunk_size=10))
+        self.assertEqual(features, self.features)
+
+    def test_stop_reading_early(self):
+        fileobj = BytesIO(self.geojson.encode())
+        features = iter_geojson_features(fileobj, chunk_size=16)
+        self.assertEqual(next(features), self.features[0])
+        self.assertLess(fileobj.tell(), len(self.geojson) / 4)
+
+    def test_empty_features(self):
+        fileobj = StringIO('{"type": "FeatureCollection", "features": []}')
+        self.assertEqual(list(iter_geojson_features(fileobj)), [])
+
+    def test_invalid_json(self):
+        for content in ('{"Wrong_geojson":}', '{"features": [{}', "[]", ""):
+            with self.assertRaises(json.JSONDecodeError, msg=content):
+                list(iter_geojson_features(StringIO(content), chunk_size=4))
+
+
+class LocalFilePathTestCase(SimpleTestCase):
+    def test_stored_file_path(self):
+        path = os.path.join(os.path.dirname(__file__), "data", "test.zip")
+        source = ShapefileSource(file=path)
+        with local_file_path(source.file) as local_path:
+            self.assertEqual(local_path, source.file.path)
+
+    def test_uncommitted_file_is_copied(self):
+        source = ShapefileSource(file=SimpleUploadedFile("test.zip", b"content"))
+        with local_file_path(source.file, suffix=".zip") as local_path:
+            self.assertTrue(local_path.endswith(".zip"))
+            with open(local_path, "rb") as f:
+                self.assertEqual(f.read(), b"content")
+        self.assertFalse(os.path.exists(local_path))
+
+
+class GeometryFromMappingTestCase(SimpleTestCase):
+    def test_same_geometry_as_gdal(self):
+        geometries = [
+            {"type": "Point", "coordinates": [1.5, 2]},
+            {"type": "Point", "coordinates": [1, 2, 3]},
+            {"type": "LineString", "coordinates": [[1, 2], [3, 4.123456789012345]]},
+            {
+                "type": "Polygon",
+                "coordinates": [
+                    [[0, 0], [1, 0], [1, 1], [0, 0]],
+                    [[0.1, 0.1], [0.2, 0.1], [0.2, 0.2], [0.1, 0.1]],
+                ],
+            },
+            {"type": "MultiPoint", "coordinates": [[1, 2], [3, 4]]},
+            {"type": "MultiLineString", "coordinates": [[[1, 2], [3, 4]]]},
+            {"type": "MultiPolygon", "coordinates": [[[[0, 0], [1, 0], [0, 0]]]]},
+            {
+                "type": "GeometryCollection",
+                "geometries": [
+                    {"type": "Point", "coordinates": [1, 2]},
+                    {"type": "LineString", "coordinates": [[1, 2], [3, 4]]},
+                ],
+            },
+            # Parsed by GDAL
+            {"type": "LineString", "coordinates": []},
+            {"type": "LineString", "coordinates": [[1, 2], [1, 2, 3]]},
+        ]
+        for mapping in geometries:
+            with self.subTest(mapping=mapping):
+                geometry = geometry_from_mapping(mapping, srid=4326)
+                self.assertEqual(geometry.ewkb, GEOSGeometry(json.dumps(mapping)).ewkb)
+
+    def test_srid(self):
+        geometry = geometry_from_mapping(
+            {"type": "Point", "coordinates": [700000, 6600000]}, srid=2154
+        )
+        self.assertEqual(geometry.srid, 2154)
+
+    def test_invalid_geometry(self):
+        with self.assertRaises(ValueError):
+            geometry_from_mapping(None, srid=4326)
+        with self.assertRaises(GDALException):
+            geometry_from_mapping({"type": "Point", "coordinates": []}, srid=4326)
+
+
+class ToWGS84TestCase(SimpleTestCase):
+    def test_to_wgs84(self):
+        geometry = "SRID=2154;POINT (700000 6600000)"
+        expected = GEOSGeometry(geometry)
+        expected.transform(4326)
+
+        with mock.patch(
+            "django_geosource.readers.CoordTransform",
+            wraps=readers.CoordTransform,
+        ) as mocked:
+            for i in range(3):
+                geom = to_wgs84(geometry)
+                self.assertEqual(geom.ewkb, expected.ewkb)
+
+        # The transformation is set up once, then reused
+        self.assertLessEqual(mocked.call_count, 1)
+        self.assertEqual(to_wgs84("SRID=4326;POINT (1 2)").srid, 4326)
@@ -0,0 +1,81 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from django_geosource.reports import ReportCollector
+
+
+@mock.patch("django_geosource.reports.REPORT_SAMPLE_SIZE", 2)
+class ReportCollectorTestCase(SimpleTestCase):
+    def test_add_keeps_samples(self):
+        report = {}
+        collector = ReportCollector(report)
+        for i in range(5):
+            collector.add("missing_identifier", f"message {i}", line=i)
+        collector.add("invalid_geometry", "invalid", status="Error")
+
+        self.assertEqual(
+            report,
+            {
+                "status": "Error",
+                "occurrences": {"missing_identifier": 5, "invalid_geometry": 1},
+                "message": ["message 0", "message 1", "invalid"],
+                "lines": {"0": ["message 0"], "1": ["message 1"]},
+            },
+        )
+
+    def test_flush_saves_changed_report(self):
+        save = mock.Mock()
+        collector = ReportCollector({}, save=save, interval=3600)
+        collector.flush()
+        save.assert_not_called()
+
+        for i in range(3):
+            collector.add("invalid_geometry", "invalid")
+        save.assert_not_called()
+        collector.flush()
+        save.assert_called_once()
+
+    def test_add_saves_after_interval(self):
+        save = mock.Mock()
+        collector = ReportCollector({}, save=save, interval=0)
+        collector.add("invalid_geometry", "invalid")
+        collector.add("invalid_geometry", "invalid")
+        self.assertEqual(save.call_count, 2)
+
+    @mock.patch("django_geosource.reports.FEATURE_BATCH_SIZE", 3)
+    def test_issues_written_by_batches(self):
+        report = {}
+        write_issues = mock.Mock()
+        collector = ReportCollector(report, issues=write_issues)
+        for i in range(4):
+            collector.add("missing_identifier", "missing", line=i)
+        write_issues.assert_called_once_with(
+            [("missing_identifier", "missing", i, "Warning") for i in range(3)]
+        )
+
+        collector.flush()
+        write_issues.assert_called_with(
+            [("missing_identifier", "missing", 3, "Warning")]
+        )
+        self.assertNotIn("lines", report)
+        self.assertEqual(report["occurrences"], {"missing_identifier": 4})
+
+    def test_merge(self):
+        report = {}
+        collector = ReportCollector(report)
+        collector.merge({"status": "success"})
+        self.assertEqual(report, {"status": "success"})
+
+        for _ in range(2):
+            collector.merge(
+                {
+                    "status": "Warning",
+                    "occurrences": {"missing_identifier": 3},
+                    "message": ["message 0", "message 1"],
+                    "lines": {"0": ["message 0"], "1": ["message 1"]},
+                }
+            )
+        self.assertEqual(report["occurrences"], {"missing_identifier": 6})
+        self.assertEqual(report["message"], ["message 0", "message 1"])
+        self.assertEqual(len(report["lines"]), 2)
@@ -3,9 +3,16 @@ import os
 from unittest import mock
 
 from django.contrib.auth.models import Group
+from django.contrib.gis.geos import GEOSGeometry
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
-from django_geosource.models import GeoJSONSource, GeometryTypes
-from django_geosource.tasks import run_model_object_method
+from django.utils import timezone
+from django_geosource.models import CSVSource, GeoJSONSource, GeometryTypes
+from django_geosource.tasks import (
+    ProgressReporter,
+    fail_source_refresh,
+    run_model_object_method,
+)
 from geostore.models import Feature, Layer
 
 
@@ -70,3 +77,226 @@ class TaskTestCase(TestCase):
             )
         )
         self.assertEqual(Layer.objects.count(), 0)
+
+    def test_task_state_stored_on_source(self):
+        self.element.run_sync_method("refresh_data")
+
+        self.assertEqual(self.element.task_state, "SUCCESS")
+        self.assertIsNotNone(self.element.task_done)
+        self.assertEqual(self.element.task_result["action"], "refresh_data")
+        with mock.patch("django_geosource.models.AsyncResult") as mocked:
+            self.assertEqual(self.element.get_status()["state"], "SUCCESS")
+            self.assertTrue(self.element.can_sync)
+        mocked.assert_not_called()
+
+    def test_task_failure_stored_on_source(self):
+        logging.disable(logging.ERROR)
+        self.element.run_sync_method("bad_method")
+
+        self.assertEqual(self.element.task_state, "FAILURE")
+        self.assertEqual(self.element.get_status()["method"], "bad_method")
+
+    def test_task_state_of_previous_task_ignored(self):
+        self.element.update_status("new-task")
+        run_model_object_method.apply(
+            (
+                self.element._meta.app_label,
+                self.element._meta.model_name,
+                self.element.pk,
+                "refresh_data",
+            ),
+            task_id="old-task",
+        )
+
+        self.element.refresh_from_db()
+        self.assertEqual(self.element.task_id, "new-task")
+        self.assertEqual(self.element.task_state, "PENDING")
+
+
+class ShardedRefreshTestCase(TestCase):
+    def setUp(self):
+        self.element = GeoJSONSource.objects.create(
+            name="test",
+            geom_type=GeometryTypes.Point.value,
+            file=os.path.join(os.path.dirname(__file__), "data", "test.geojson"),
+            shards=3,
+        )
+
+    def get_records(self, *args, **kwargs):
+        for i in range(2, 12):
+            yield {"_geom_": f"SRID=4326;POINT ({i} {i})", "id": i}
+
+    def test_shards_split_records(self):
+        with mock.patch.object(
+            GeoJSONSource, "_get_records", side_effect=self.get_records
+        ):
+            shards = [
+                [record["id"] for i, record in self.element._get_shard_records(shard)]
+                for shard in range(3)
+            ]
+
+        self.assertEqual(sorted(sum(shards, [])), list(range(2, 12)))
+        self.assertTrue(all(shards))
+
+    def test_csv_shards_build_their_geometries(self):
+        content = "".join(f"{i};{i};{i}\n" for i in range(6)) + "x;;6\n"
+        source = CSVSource.objects.create(
+            name="csv",
+            geom_type=GeometryTypes.Point.value,
+            file=SimpleUploadedFile("source.csv", content.encode()),
+            id_field="2",
+            shards=3,
+            settings={
+                "encoding": "UTF-8",
+                "coordinate_reference_system": "EPSG_4326",
+                "char_delimiter": "doublequote",
+                "field_separator": "semicolon",
+                "decimal_separator": "point",
+                "use_header": False,
+                "coordinates_field": "two_columns",
+                "latitude_field": "1",
+                "longitude_field": "0",
+            },
+        )
+        with mock.patch(
+            "django_geosource.models.GEOSGeometry", wraps=GEOSGeometry
+        ) as mocked:
+            shards = [list(source._get_shard_records(shard)) for shard in range(3)]
+
+        # Each record is parsed by its shard only, with its line in the file
+        self.assertEqual(mocked.call_count, 7)
+        self.assertEqual(
+            sorted((i, record["2"]) for i, record in sum(shards, [])),
+            [(i, i) for i in range(6)],
+        )
+
+    def test_shard_report_has_reader_warnings(self):
+        with mock.patch.object(
+            GeoJSONSource,
+            "_get_records",
+            side_effect=self.get_invalid_records,
+        ):
+            results = [
+                self.element.refresh_shard(shard, timezone.now()) for shard in range(3)
+            ]
+
+        # Each shard read the records, and reported it
+        self.assertEqual(
+            [result["report"]["occurrences"]["reader_warning"] for result in results],
+            [1, 1, 1],
+        )
+
+    def get_invalid_records(self, *args, **kwargs):
+        collector = self.element._get_report_collector()
+        collector.add("reader_warning", "Ignored record", line=0)
+        collector.flush()
+        yield from self.get_records()
+
+    def test_sharded_refresh(self):
+        with mock.patch.object(
+            GeoJSONSource, "_get_records", side_effect=self.get_records
+        ), mock.patch.object(
+            GeoJSONSource,
+            "refresh_shard",
+            autospec=True,
+            side_effect=GeoJSONSource.refresh_shard,
+        ) as mocked:
+            self.element.run_async_method("refresh_data")
+
+        self.assertEqual(mocked.call_count, 3)
+        self.assertEqual(Feature.objects.count(), 10)
+        self.element.refresh_from_db()
+        self.assertEqual(self.element.report["status"], "success")
+        self.assertEqual(self.element.task_state, "SUCCESS")
+
+    def test_sharded_refresh_clear_features_once_done(self):
+        self.element.refresh_data()
+        self.assertEqual(Feature.objects.count(), 1)
+
+        with mock.patch.object(
+            GeoJSONSource, "_get_records", side_effect=self.get_records
+        ):
+            self.element.run_async_method("refresh_data")
+
+        # The feature from the previous refresh is not in the source anymore
+        self.assertFalse(Feature.objects.filter(identifier="1").exists())
+        self.assertEqual(Feature.objects.count(), 10)
+
+    def test_failed_shard_releases_source(self):
+        self.element.update_status("finish-task")
+        request = mock.Mock(id="finish-task")
+
+        with mock.patch(
+            "django_geosource.tasks.run_auto_refresh_source.delay"
+        ) as mocked:
+            fail_source_refresh(
+                request,
+                Exception("Shard failed"),
+                None,
+                self.element._meta.app_label,
+                self.element._meta.model_name,
+                self.element.pk,
+            )
+
+        self.element.refresh_from_db()
+        self.assertEqual(self.element.task_state, "FAILURE")
+        self.assertEqual(self.element.task_result["exc_message"], ["Shard failed"])
+        self.assertIsNotNone(self.element.task_done)
+        self.assertTrue(self.element.can_sync)
+        mocked.assert_called_once()
+
+
+class ProgressReporterTestCase(TestCase):
+    @mock.patch("django_geosource.tasks.current_task")
+    def test_progress_is_throttled(self, mock_task):
+        mock_task.request.id = "task"
+        progress = ProgressReporter(total=10, interval=3600)
+
+        for i in range(5):
+            progress.advance("import")
+        mock_task.update_state.assert_not_called()
+
+        progress.publish("clear", force=True)
+        mock_task.update_state.assert_called_once()
+        self.assertEqual(mock_task.update_state.call_args[1]["state"], "PROGRESS")
+        meta = mock_task.update_state.call_args[1]["meta"]
+        self.assertEqual((meta["done"], meta["total"], meta["stage"]), (5, 10, "clear"))
+        self.assertGreater(meta["eta"], 0)
+
+    @mock.patch("django_geosource.tasks.current_task", None)
+    def test_progress_out_of_task(self):
+        progress = ProgressReporter(interval=0)
+        progress.advance("import")
+        self.assertEqual(progress.done, 1)
+
+    @mock.patch("django_geosource.models.AsyncResult")
+    def test_get_status_progress(self, mock_result):
+        element = GeoJSONSource.objects.create(
+            name="test",
+            geom_type=GeometryTypes.Point.value,
+            file=os.path.join(os.path.dirname(__file__), "data", "test.geojson"),
+            task_id="task",
+        )
+        mock_result.return_value.state = "PROGRESS"
+        mock_result.return_value.info = {"done": 5, "total": 10}
+        mock_result.return_value.successful.return_value = False
+        mock_result.return_value.failed.return_value = False
+
+        self.assertEqual(element.get_status()["progress"], {"done": 5, "total": 10})
+
+    @mock.patch("django_geosource.models.AsyncResult")
+    def test_get_status_progress_of_started_task(self, mock_result):
+        element = GeoJSONSource.objects.create(
+            name="test",
+            geom_type=GeometryTypes.Point.value,
+            file=os.path.join(os.path.dirname(__file__), "data", "test.geojson"),
+            task_id="task",
+            task_state="STARTED",
+        )
+        mock_result.return_value.state = "PROGRESS"
+        mock_result.return_value.info = {"done": 5, "total": 10}
+
+        status = element.get_status()
+        self.assertEqual(status["state"], "PROGRESS")
+        self.assertEqual(status["progress"], {"done": 5, "total": 10})
+        self.assertEqual(element.get_status(progress=False)["state"], "STARTED")
@@ -0,0 +1,48 @@
+import time
+
+from django.test import SimpleTestCase
+from django_geosource.timers import StageTimer
+
+
+class StageTimerTestCase(SimpleTestCase):
+    def test_nested_stages_are_excluded(self):
+        timer = StageTimer()
+        with timer.stage("outer"):
+            time.sleep(0.01)
+            with timer.stage("inner", items=3):
+                time.sleep(0.05)
+
+        stages = timer.as_dict()
+        self.assertLess(stages["outer"]["wall"], 0.05)
+        self.assertGreaterEqual(stages["inner"]["wall"], 0.05)
+        self.assertEqual(stages["inner"]["items"], 3)
+        self.assertAlmostEqual(
+            stages["inner"]["items_per_second"], 3 / stages["inner"]["wall"]
+        )
+
+    def test_iterate(self):
+        timer = StageTimer()
+
+        def records():
+            for i in range(4):
+                time.sleep(0.01)
+                yield i
+
+        with timer.stage("other"):
+            self.assertEqual(list(timer.iterate("read", records())), [0, 1, 2, 3])
+
+        stages = timer.as_dict()
+        self.assertEqual(stages["read"]["items"], 4)
+        self.assertGreaterEqual(stages["read"]["wall"], 0.04)
+        self.assertLess(stages["other"]["wall"], stages["read"]["wall"])
+
+    def test_merge(self):
+        timer = StageTimer({"read": {"wall": 1, "cpu": 0.5, "items": 10}})
+        timer.merge(
+            {"read": {"wall": 2, "cpu": 1, "items": 20, "items_per_second": 10}}
+        )
+
+        self.assertEqual(
+            timer.as_dict()["read"],
+            {"wall": 3, "cpu": 1.5, "items": 30, "items_per_second": 10},
+        )
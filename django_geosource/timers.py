@@ -0,0 +1,69 @@
+import time
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """Accumulate wall time, CPU time and item counts of refresh stages.
+
+    Time spent in a stage nested in another one is only counted for the nested
+    stage, so stage times add up to the refresh duration.
+    """
+
+    def __init__(self, stages=None):
+        self.stages = {}
+        self._stack = []
+        if stages:
+            self.merge(stages)
+
+    def merge(self, stages):
+        """Add stages as returned by as_dict to the timer"""
+        for name, values in stages.items():
+            stage = self._get(name)
+            for key in ("wall", "cpu", "items"):
+                stage[key] += values.get(key, 0)
+
+    def _get(self, name):
+        return self.stages.setdefault(name, {"wall": 0, "cpu": 0, "items": 0})
+
+    @contextmanager
+    def stage(self, name, items=0):
+        """Count the time spent in the block, the stage values are given to it"""
+        stage = self._get(name)
+        stage["items"] += items
+        # Wall and CPU starts, then time spent in nested stages
+        frame = [time.perf_counter(), time.process_time(), 0, 0]
+        self._stack.append(frame)
+        try:
+            yield stage
+        finally:
+            self._stack.pop()
+            wall = time.perf_counter() - frame[0]
+            cpu = time.process_time() - frame[1]
+            stage["wall"] += wall - frame[2]
+            stage["cpu"] += cpu - frame[3]
+            if self._stack:
+                self._stack[-1][2] += wall
+                self._stack[-1][3] += cpu
+
+    def iterate(self, name, iterable):
+        """Yield items of iterable, counting the time spent to get them in a stage"""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name) as stage:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                stage["items"] += 1
+            yield item
+
+    def as_dict(self):
+        return {
+            name: {
+                **stage,
+                "items_per_second": stage["items"] / stage["wall"]
+                if stage["wall"]
+                else None,
+            }
+            for name, stage in self.stages.items()
+        }
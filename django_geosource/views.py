@@ -1,13 +1,34 @@
+import hashlib
+
+from django.utils.dateparse import parse_datetime
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
-from .models import Source
+from .app_settings import PREVIEW_SIZE
+from .models import IssueSeverity, Source
 from .parsers import NestedMultipartJSONParser
 from .permissions import SourcePermission
-from .serializers import SourceListSerializer, SourceSerializer
+from .serializers import (
+    RefreshIssueSerializer,
+    SourceListSerializer,
+    SourceSerializer,
+)
+
+
+class PropertyValuesPagination(PageNumberPagination):
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+
+class RefreshIssuePagination(PageNumberPagination):
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
 
 
 class SourceModelViewset(ModelViewSet):
@@ -55,8 +76,13 @@ class SourceModelViewset(ModelViewSet):
         Returns all distinct values of specified GET "property" params from
         database for the specified source layer.
 
-        Note: if some record has no value for this property, None is contained in the
+        Note: if some record has no value for this property, None is contained in the
         result list.
+
+        Values can be filtered by prefix with the "search" GET param. With a "page"
+        GET param, the response is paginated, and has the count of records of each
+        value. Values are read from those indexed by the last refresh, else from the
+        layer.
         """
         property_to_list = request.query_params.get("property")
         if not property_to_list:
@@ -66,6 +92,101 @@ class SourceModelViewset(ModelViewSet):
             )
 
         source = self.get_object()
-        result = source.get_layer().get_property_values(property_to_list)
 
-        return Response(result)
+        # Values only change with a refresh of the source
+        signature = (
+            f"{source.pk}-{source.last_refresh.isoformat()}-{request.GET.urlencode()}"
+        )
+        etag = f'"{hashlib.sha1(signature.encode()).hexdigest()}"'
+        if request.headers.get("If-None-Match") == etag:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+        search = request.query_params.get("search")
+        values = source.field_values.filter(field=property_to_list)
+        if values.exists():
+            if search:
+                values = values.filter(text__startswith=search)
+            result = values.order_by("text").values("value", "count")
+        else:
+            result = [
+                {"value": value, "count": None}
+                for value in source.get_layer().get_property_values(property_to_list)
+                if not search or (value is not None and str(value).startswith(search))
+            ]
+
+        if "page" not in request.query_params:
+            return Response(
+                [value["value"] for value in result], headers={"ETag": etag}
+            )
+
+        paginator = PropertyValuesPagination()
+        page = paginator.paginate_queryset(result, request, view=self)
+        response = paginator.get_paginated_response(page)
+        response["ETag"] = etag
+        return response
+
+    @action(detail=True, methods=["get"])
+    def preview(self, request, pk):
+        """
+        Returns the first records of the source, and the fields inferred from them.
+
+        At most GEOSOURCE_PREVIEW_SIZE records are returned, fewer with the "limit"
+        GET param.
+        """
+        try:
+            limit = min(
+                int(request.query_params.get("limit", PREVIEW_SIZE)), PREVIEW_SIZE
+            )
+        except ValueError:
+            return Response(
+                {"error": 'Invalid "limit" GET parameter'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        source = self.get_object()
+        return Response(source.get_preview(max(limit, 1)))
+
+    @action(detail=True, methods=["get"])
+    def issues(self, request, pk):
+        """
+        Returns the issues met on records by the last refresh of the source, and by
+        the running one, paginated and ordered by line.
+
+        They can be filtered with the "severity" (0 for warnings, 1 for errors),
+        "kind" and "run" (beginning date of the refresh) GET params.
+        """
+        source = self.get_object()
+        issues = source.issues.order_by("run", "line", "pk")
+
+        severity = request.query_params.get("severity")
+        if severity is not None:
+            try:
+                issues = issues.filter(severity=IssueSeverity(int(severity)))
+            except ValueError:
+                return Response(
+                    {"error": 'Invalid "severity" GET parameter'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+        kind = request.query_params.get("kind")
+        if kind:
+            issues = issues.filter(kind=kind)
+
+        run = request.query_params.get("run")
+        if run:
+            try:
+                run = parse_datetime(run)
+            except ValueError:
+                run = None
+            if run is None:
+                return Response(
+                    {"error": 'Invalid "run" GET parameter'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            issues = issues.filter(run=run)
+
+        paginator = RefreshIssuePagination()
+        page = paginator.paginate_queryset(issues, request, view=self)
+        return paginator.get_paginated_response(
+            RefreshIssueSerializer(page, many=True).data
+        )
@@ -52,6 +52,7 @@ setup(
         "psycopg2",
         "Fiona",
         "pyexcel",
+        "pyexcel-io",
     ],
     tests_require=test_require,
     extras_require={
@@ -0,0 +1,201 @@
+"""Synthetic sources used to benchmark refreshes.
+
+Generators write their features one by one, so sources of millions of features
+can be built without holding them in memory. Coordinates are pseudo random, but
+deterministic for a given size.
+"""
+import csv
+import json
+import os
+import random
+import zipfile
+
+import fiona
+from django.conf import settings
+from django.db import connection
+from django_geosource.models import (
+    CSVSource,
+    GeoJSONSource,
+    GeometryTypes,
+    PostGISSource,
+    ShapefileSource,
+)
+
+SOURCE_TYPES = ("geojson", "shapefile", "csv", "csv_one_column", "postgis")
+
+# Bounding box of France in Lambert-93 (EPSG:2154)
+LAMBERT93_BBOX = (100000, 6050000, 1250000, 7110000)
+WGS84_BBOX = (-5, 42, 8, 51)
+
+CSV_SETTINGS = {
+    "encoding": "UTF-8",
+    "coordinate_reference_system": "EPSG_2154",
+    "char_delimiter": "doublequote",
+    "field_separator": "semicolon",
+    "decimal_separator": "point",
+    "use_header": True,
+}
+
+
+def iter_points(size, bbox):
+    rand = random.Random(size)
+    xmin, ymin, xmax, ymax = bbox
+    for i in range(size):
+        yield i, round(rand.uniform(xmin, xmax), 6), round(rand.uniform(ymin, ymax), 6)
+
+
+def get_properties(i):
+    return {"id": i, "name": f"feature {i}", "value": i * 0.5, "category": i % 10}
+
+
+def write_geojson(path, size):
+    with open(path, "w") as f:
+        f.write('{"type": "FeatureCollection", "features": [\n')
+        for i, x, y in iter_points(size, WGS84_BBOX):
+            feature = {
+                "type": "Feature",
+                "properties": get_properties(i),
+                "geometry": {"type": "Point", "coordinates": [x, y]},
+            }
+            f.write(("," if i else "") + json.dumps(feature) + "\n")
+        f.write("]}\n")
+
+
+def write_shapefile(path, size):
+    directory = os.path.splitext(path)[0]
+    os.makedirs(directory)
+    schema = {
+        "geometry": "Point",
+        "properties": {
+            "id": "int",
+            "name": "str",
+            "value": "float",
+            "category": "int",
+        },
+    }
+    shp_path = os.path.join(directory, "benchmark.shp")
+    with fiona.open(
+        shp_path, "w", driver="ESRI Shapefile", crs={"init": "epsg:2154"}, schema=schema
+    ) as shapefile:
+        for i, x, y in iter_points(size, LAMBERT93_BBOX):
+            shapefile.write(
+                {
+                    "geometry": {"type": "Point", "coordinates": (x, y)},
+                    "properties": get_properties(i),
+                }
+            )
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name in os.listdir(directory):
+            archive.write(os.path.join(directory, name), name)
+
+
+def write_csv(path, size, one_column=False):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        if one_column:
+            writer.writerow(["id", "name", "value", "category", "coordxy"])
+        else:
+            writer.writerow(["id", "name", "value", "category", "x", "y"])
+        for i, x, y in iter_points(size, LAMBERT93_BBOX):
+            row = list(get_properties(i).values())
+            writer.writerow(row + [f"{x},{y}"] if one_column else row + [x, y])
+
+
+def get_table_name(size):
+    return f"geosource_benchmark_{size}"
+
+
+def create_postgis_table(table, size):
+    xmin, ymin, xmax, ymax = LAMBERT93_BBOX
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        cursor.execute(
+            f"""
+            CREATE TABLE {table} AS
+            SELECT i AS id, 'feature ' || i AS name, i * 0.5 AS value,
+                i % 10 AS category,
+                ST_SetSRID(ST_MakePoint(
+                    {xmin} + random() * {xmax - xmin},
+                    {ymin} + random() * {ymax - ymin}
+                ), 2154) AS geom
+            FROM generate_series(0, %s - 1) AS i
+            """,
+            [size],
+        )
+
+
+def drop_postgis_table(table):
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+def create_source(source_type, size, directory):
+    """Generate a source of size features, and return its Source object"""
+    name = f"benchmark {source_type} {size}"
+    point = GeometryTypes.Point.value
+
+    if source_type == "geojson":
+        path = os.path.join(directory, "benchmark.geojson")
+        write_geojson(path, size)
+        return GeoJSONSource.objects.create(name=name, geom_type=point, file=path)
+
+    if source_type == "shapefile":
+        path = os.path.join(directory, "benchmark.zip")
+        write_shapefile(path, size)
+        return ShapefileSource.objects.create(name=name, geom_type=point, file=path)
+
+    if source_type == "csv":
+        path = os.path.join(directory, "benchmark.csv")
+        write_csv(path, size)
+        return CSVSource.objects.create(
+            name=name,
+            geom_type=point,
+            file=path,
+            settings={
+                **CSV_SETTINGS,
+                "coordinates_field": "two_columns",
+                "longitude_field": "x",
+                "latitude_field": "y",
+            },
+        )
+
+    if source_type == "csv_one_column":
+        path = os.path.join(directory, "benchmark.csv")
+        write_csv(path, size, one_column=True)
+        return CSVSource.objects.create(
+            name=name,
+            geom_type=point,
+            file=path,
+            settings={
+                **CSV_SETTINGS,
+                "coordinates_field": "one_column",
+                "latlong_field": "coordxy",
+                "coordinates_separator": "comma",
+                "coordinates_field_count": "xy",
+            },
+        )
+
+    if source_type == "postgis":
+        table = get_table_name(size)
+        create_postgis_table(table, size)
+        database = settings.DATABASES["default"]
+        return PostGISSource.objects.create(
+            name=name,
+            geom_type=point,
+            db_host=database["HOST"],
+            db_port=database["PORT"] or 5432,
+            db_username=database["USER"],
+            db_password=database["PASSWORD"],
+            db_name=database["NAME"],
+            query=f"SELECT * FROM {table}",
+            geom_field="geom",
+        )
+
+    raise ValueError(f"Unknown source type: {source_type}")
+
+
+def delete_source(source, size):
+    if isinstance(source, PostGISSource):
+        drop_postgis_table(get_table_name(size))
+    source.delete()
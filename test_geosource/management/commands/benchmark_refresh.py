@@ -0,0 +1,131 @@
+import json
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import django
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand
+from django.db import connection
+from test_geosource.benchmark import SOURCE_TYPES, create_source, delete_source
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = "Benchmark refreshes of synthetic sources, and write results as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--types",
+            nargs="+",
+            choices=SOURCE_TYPES,
+            default=SOURCE_TYPES,
+            help="Types of source to benchmark",
+        )
+        parser.add_argument(
+            "--sizes",
+            nargs="+",
+            type=int,
+            default=[10000, 100000, 1000000],
+            help="Number of features of generated sources",
+        )
+        parser.add_argument(
+            "--output",
+            default="benchmark.json",
+            help="Path of the JSON results file",
+        )
+        parser.add_argument(
+            "--single",
+            nargs=2,
+            metavar=("TYPE", "SIZE"),
+            help="Run one benchmark in this process, and print its result",
+        )
+
+    def handle(self, *args, **options):
+        if options["single"]:
+            source_type, size = options["single"]
+            result = self.run_benchmark(source_type, int(size))
+            self.stdout.write(json.dumps(result))
+            return
+
+        results = {
+            "date": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "settings": {
+                key: getattr(settings, key)
+                for key in dir(settings)
+                if key.startswith("GEOSOURCE_")
+            },
+            "results": [],
+        }
+        for source_type in options["types"]:
+            for size in options["sizes"]:
+                self.stdout.write(f"Benchmark {source_type} source of {size} features")
+                result = self.run_subprocess(source_type, size, options)
+                results["results"].append(result)
+                self.stdout.write(json.dumps(result))
+
+        with open(options["output"], "w") as f:
+            json.dump(results, f, indent=2, default=str)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def run_subprocess(self, source_type, size, options):
+        """Each benchmark runs in its own process, to measure its peak memory"""
+        command = [sys.executable, sys.argv[0], "benchmark_refresh"]
+        command += ["--single", source_type, str(size)]
+        if options["settings"]:
+            command += ["--settings", options["settings"]]
+        output = subprocess.run(
+            command, check=True, stdout=subprocess.PIPE, universal_newlines=True
+        ).stdout
+        return json.loads(output.splitlines()[-1])
+
+    def run_benchmark(self, source_type, size):
+        result = {"type": source_type, "size": size}
+
+        # Source files must be in the storage location to be read from their path
+        with tempfile.TemporaryDirectory(dir=default_storage.location) as directory:
+            start = time.perf_counter()
+            source = create_source(source_type, size, directory)
+            result["generation_duration"] = time.perf_counter() - start
+
+            try:
+                for method in ("update_fields", "refresh_data"):
+                    result[method] = self.measure(source, method)
+            finally:
+                delete_source(source, size)
+
+        result["features_per_second"] = size / result["refresh_data"]["duration"]
+        # ru_maxrss is in kilobytes on Linux
+        result["peak_rss_mb"] = (
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        )
+        return result
+
+    def measure(self, source, method):
+        counter = QueryCounter()
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+
+        with connection.execute_wrapper(counter):
+            getattr(source, method)()
+
+        return {
+            "duration": time.perf_counter() - start,
+            "cpu_duration": time.process_time() - cpu_start,
+            "queries": counter.count,
+        }